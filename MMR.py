@@ -1,15 +1,19 @@
-import gspread
-from gspread.utils import ValueRenderOption
-import numpy as np
-from google.oauth2.service_account import Credentials
-import sys
 import os
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from appconfig import ConfigService, get_data_path
 
 '''
 author: Zakaria Hayaty (Blazico)
 '''
 
+# gspread, google.oauth2 and numpy are imported at the top of the functions that use them,
+# so that loading this module does not slow down the start of the program. Keep them out
+# of the module level imports above, benchmark.py fails when they are loaded at import time
+
 # MMR Ranges
 # Tin: 0-1999
 # Bronze: 2000-2999
@@ -35,42 +39,480 @@ MMR_THRESHOLDS = {
     170: 7250, 180: 7500
 }
 
+# Number of racers per team for every mode
+TEAM_SIZES = {"FFA": 1, "2vs2": 2, "3vs3": 3, "4vs4": 4, "5vs5": 5, "6vs6": 6}
+
+# Table_stuff ranges holding the K values of every mode
+K_RANGES = {
+    "FFA": "E11:E22",
+    "2vs2": "F11:F16",
+    "3vs3": "G11:G14",
+    "4vs4": "H11:H13",
+    "5vs5": "I11:I12",
+    "6vs6": "I11:I12",
+}
+
+# Cached K and C values are reloaded after this many seconds, even without a forced refresh
+PARAMETER_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+def placement_MMR(points, previous_season_MMR=None, mmr_accum=0):
+    '''
+    Assume the MMR of an unplaced racer from their placement events
+
+    Args:
+        points: Points of the current event followed by those of the earlier placement events
+        previous_season_MMR: MMR of the previous season, only given for the final placement event
+        mmr_accum: MMR gained or lost during the earlier placement events
+
+    Returns:
+        The assumed MMR of the racer
+    '''
+    import numpy as np
+
+    # Calculate the average number of points in the past event(s)
+    average = np.average(points)
+
+    # Calculate the MMR of the racer based on the average
+    for threshold, mmr in MMR_THRESHOLDS.items():
+        if average < threshold:
+            MMR = mmr
+            break
+    else:
+        MMR = 7750
+
+    # MMR is average with previous season MMR
+    if previous_season_MMR is not None and previous_season_MMR != "???":
+        MMR = (MMR + int(previous_season_MMR)) / 2
+
+    # Add previously gained MMR to the new MMR
+    return MMR + mmr_accum
+
+def rank_teams(scores, team_size):
+    '''
+    Find the rankings of the racers, taking ties into account
+
+    Teams are formed by consecutive racers and are expected in finishing order.
+    A team shares the ranking of the team above it when their total scores are equal.
+    Racers left over after the full teams, e.g. after a disconnect, form a short last team.
+
+    Args:
+        scores: Scores of the racers, in table order
+        team_size: Number of racers per team
+
+    Returns:
+        np.ndarray: Ranking of every racer, starting at 1
+    '''
+    import numpy as np
+
+    scores = np.asarray(scores)
+    num_racers = scores.size
+
+    # The missing racers of a short last team score nothing
+    missing = -num_racers % team_size
+    if missing:
+        scores = np.concatenate((scores, np.zeros(missing, dtype=scores.dtype)))
+
+    # Total score per team
+    team_scores = scores.reshape(-1, team_size).sum(axis=1)
+
+    # A new ranking starts wherever the score differs from the team above
+    positions = np.arange(1, team_scores.size + 1)
+    new_rank = np.ones(team_scores.size, dtype=bool)
+    new_rank[1:] = team_scores[1:] != team_scores[:-1]
+    team_rankings = np.maximum.accumulate(np.where(new_rank, positions, 0))
+
+    # Every team member gets the ranking of the team
+    return np.repeat(team_rankings, team_size)[:num_racers]
+
+def calculate_mmr_changes(LR, K, C, team_size, flag_32track=False, flag_200cc=False, p_mu=5800):
+    '''
+    Calculate the MMR change and new MMR of every racer in a room
+
+    The change of a team is the sum of its members' changes divided by the team size,
+    also for a short last team.
+
+    Args:
+        LR: Current MMR of every racer, in table order
+        K: K value of every racer, matching their ranking
+        C: The C constant
+        team_size: Number of racers per team
+        flag_32track: Whether the event was a 32 track event
+        flag_200cc: Whether the event was a 200cc event
+        p_mu: Spread of the expected score curve
+
+    Returns:
+        Tuple of two np.ndarrays holding the rounded MMR changes and new MMRs
+    '''
+    import numpy as np
+
+    LR = np.asarray(LR, dtype=float)
+    K = np.asarray(K, dtype=float)
+    num_racers = LR.size
+
+    # The equation for the change in MMR, relative to the average MMR of the room
+    u = LR.mean()
+    delta_MMRs = C/12 + C/(1 + np.power(11.0, -(u - LR)/p_mu)) - K
+
+    # The missing racers of a short last team add nothing to its average
+    missing = -num_racers % team_size
+    if missing:
+        delta_MMRs = np.concatenate((delta_MMRs, np.zeros(missing)))
+
+    # Average MMR gain for the teams
+    delta_MMRs = np.repeat(delta_MMRs.reshape(-1, team_size).mean(axis=1), team_size)[:num_racers]
+
+    # Modify MMR if 32 track mode is enabled
+    if flag_32track:
+        delta_MMRs = np.where(delta_MMRs > 0, delta_MMRs * 2.67, delta_MMRs * 0.67)
+
+    # Modify MMR if 200cc mode is enabled - halve losses only
+    if flag_200cc:
+        delta_MMRs = np.where(delta_MMRs > 0, delta_MMRs, delta_MMRs * 0.5)
+
+    # Round the MMR changes and new MMR values to integers
+    delta_MMRs = np.round(delta_MMRs).astype(int)
+    MMR_new = np.round(LR + delta_MMRs).astype(int)
+
+    return delta_MMRs, MMR_new
+
+class PlayerIndex():
+    '''
+    In-memory index of the Playerdata worksheet.
+
+    The whole worksheet is read with a single get_all_values() call, after which
+    every player lookup is served from memory. Lookups are case-insensitive and
+    return the first matching cell in row-major order, like Worksheet.find().
+    '''
+    def __init__(self, worksheet) -> None:
+        self.worksheet = worksheet
+        self.load()
+
+    def load(self):
+        '''
+        This method (re)reads the complete worksheet using a single API call
+        '''
+        self.rows = self.worksheet.get_all_values()
+
+        # Map every casefolded cell value to the first (row, column) it appears in
+        self.cells = {}
+        for row_idx, row in enumerate(self.rows, start=1):
+            for col_idx, value in enumerate(row, start=1):
+                self._add_cell(row_idx, col_idx, value)
+
+        # The first empty row in the name column is where new players are appended
+        self.next_row = 1
+        for row_idx, row in enumerate(self.rows, start=1):
+            if row and row[0]:
+                self.next_row = row_idx + 1
+
+    def _add_cell(self, row, col, value):
+        '''
+        This method registers a cell value in the lookup map if it is not yet known
+        '''
+        if value is None or value == "":
+            return
+        key = str(value).casefold()
+        if key not in self.cells:
+            self.cells[key] = (row, col)
+
+    def find(self, query):
+        '''
+        This method finds the first cell matching the query, ignoring case
+
+        Args:
+            query: The value to search for, usually a player name
+
+        Returns:
+            gspread.cell.Cell: The matching cell or None if not found
+        '''
+        from gspread.cell import Cell
+
+        position = self.cells.get(str(query).casefold())
+        if position is None:
+            return None
+        row, col = position
+        return Cell(row, col, self.value(row, col))
+
+    def value(self, row, col):
+        '''
+        This method returns the value of a cell from memory
+
+        Args:
+            row: 1-based row number
+            col: 1-based column number
+
+        Returns:
+            str: The cell value or None if the cell is empty
+        '''
+        if row - 1 < len(self.rows) and col - 1 < len(self.rows[row - 1]):
+            value = self.rows[row - 1][col - 1]
+            if value != "":
+                return value
+        return None
+
+    def set_value(self, row, col, value):
+        '''
+        This method updates a cell in memory after it has been written to the sheet
+
+        Args:
+            row: 1-based row number
+            col: 1-based column number
+            value: The new value of the cell
+        '''
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = str(value)
+        self._add_cell(row, col, value)
+
+    def append(self, values):
+        '''
+        This method records a newly appended player row
+
+        Args:
+            values: Dictionary mapping 1-based column numbers to the written values
+
+        Returns:
+            int: The row the player was appended to
+        '''
+        row = self.next_row
+        for col, value in values.items():
+            self.set_value(row, col, value)
+        self.next_row += 1
+        return row
+
+class WritePlan():
+    '''
+    Collects pending cell changes across worksheets and sends them together.
+
+    All value updates are sent in a single values_batch_update call, followed by
+    a single values_batch_clear call for the ranges that have to be emptied.
+    Nothing is written to the sheet until commit() is called. The number of
+    cells sent and API calls made are counted over the lifetime of the plan.
+    '''
+    def __init__(self, spreadsheet, value_input_option=None) -> None:
+        '''
+        Args:
+            spreadsheet: The spreadsheet to write to
+            value_input_option: How the sheet interprets the values, ValueInputOption.raw by default
+        '''
+        from gspread.utils import ValueInputOption
+
+        self.spreadsheet = spreadsheet
+        self.value_input_option = value_input_option or ValueInputOption.raw
+        self.data = []
+        self.clears = []
+        
+        # Statistics of everything committed with this plan
+        self.cells_sent = 0
+        self.calls_made = 0
+
+    def update(self, worksheet, range_name, values):
+        '''
+        This method queues an update of a range of cells
+
+        Args:
+            worksheet: The worksheet the range belongs to
+            range_name: Range in A1 notation, e.g. "F3:F14"
+            values: List of rows holding the new values
+        '''
+        from gspread.utils import absolute_range_name
+
+        self.data.append({
+            'range': absolute_range_name(worksheet.title, range_name),
+            'values': values
+        })
+
+    def update_cell(self, worksheet, row, col, value):
+        '''
+        This method queues an update of a single cell
+
+        Args:
+            worksheet: The worksheet the cell belongs to
+            row: 1-based row number
+            col: 1-based column number
+            value: The new value of the cell
+        '''
+        from gspread.utils import rowcol_to_a1
+
+        self.update(worksheet, rowcol_to_a1(row, col), [[value]])
+
+    def clear(self, worksheet, ranges):
+        '''
+        This method queues clearing one or more ranges
+
+        Args:
+            worksheet: The worksheet the ranges belong to
+            ranges: List of ranges in A1 notation
+        '''
+        from gspread.utils import absolute_range_name
+
+        for range_name in ranges:
+            self.clears.append(absolute_range_name(worksheet.title, range_name))
+
+    def is_empty(self):
+        '''
+        This method checks whether there are any pending changes
+        '''
+        return not self.data and not self.clears
+
+    def commit(self, progress_callback=None):
+        '''
+        This method sends all pending changes to the spreadsheet
+
+        Args:
+            progress_callback: Function to report progress (percentage, message)
+        '''
+        if self.data:
+            if progress_callback:
+                progress_callback(90, f"Writing {len(self.data)} updates to the sheet...")
+            self.spreadsheet.values_batch_update(body={
+                'valueInputOption': self.value_input_option,
+                'data': self.data
+            })
+            self.cells_sent += sum(len(row) for update in self.data for row in update['values'])
+            self.calls_made += 1
+
+        if self.clears:
+            if progress_callback:
+                progress_callback(95, "Clearing tournament tables...")
+            self.spreadsheet.values_batch_clear(body={'ranges': self.clears})
+            self.calls_made += 1
+
+        # Everything has been sent, start with an empty plan again
+        self.data = []
+        self.clears = []
+
+class ParameterCache():
+    '''
+    Persistent cache of the K values and C constant from Table_stuff.
+
+    The values only change when the league settings are changed, so they are kept
+    on disk and reused across runs. Entries are stored per spreadsheet, mode and room
+    size, because the Table_stuff formulas depend on both the mode in C1 and the room
+    size in C2. They expire after PARAMETER_CACHE_MAX_AGE seconds or when clear() is called.
+    '''
+    def __init__(self, path=None, spreadsheet_id=None, max_age=PARAMETER_CACHE_MAX_AGE) -> None:
+        '''
+        Args:
+            path: JSON file to keep the cache in, or None to only keep it in memory
+            spreadsheet_id: ID of the spreadsheet the values belong to
+            max_age: Number of seconds an entry stays valid
+        '''
+        self.path = path
+        self.spreadsheet_id = str(spreadsheet_id)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        # Load the entries of this spreadsheet from disk
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    entries = json.load(f).get(self.spreadsheet_id, {})
+                # Entries without a mode in their key were read for whatever mode C1 held, they are dropped
+                self.entries = {key: entry for key, entry in entries.items() if '/' in key}
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                print(f"Ignoring unreadable parameter cache {self.path}: {e}")
+
+    @staticmethod
+    def _key(mode, num_players):
+        return f"{mode}/{num_players}"
+
+    def get(self, mode, num_players):
+        '''
+        This method returns the cached parameters for a mode and room size
+
+        Args:
+            mode: The mode of the room
+            num_players: Number of racers in the room
+
+        Returns:
+            dict: Dictionary with the K values of the mode under 'k' and the C value under 'C', or None
+        '''
+        with self.lock:
+            entry = self.entries.get(self._key(mode, num_players))
+        if entry is None or time.time() - entry['fetched'] > self.max_age:
+            return None
+        return entry
+
+    def store(self, mode, num_players, k_list, C):
+        '''
+        This method stores freshly read parameters for a mode and room size
+
+        Args:
+            mode: The mode of the room
+            num_players: Number of racers in the room
+            k_list: List of K values of the mode
+            C: The C value
+
+        Returns:
+            dict: The stored entry
+        '''
+        entry = {'fetched': time.time(), 'k': k_list, 'C': C}
+        with self.lock:
+            self.entries[self._key(mode, num_players)] = entry
+            self._save()
+        return entry
+
+    def clear(self):
+        '''
+        This method forgets all cached parameters so the next run reads them from the sheet
+        '''
+        with self.lock:
+            self.entries = {}
+            self._save()
+
+    def _save(self):
+        '''
+        This method writes the entries of this spreadsheet to disk
+        '''
+        if not self.path:
+            return
+
+        # Keep the entries of other spreadsheets in the same file
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                data = {}
+        data[self.spreadsheet_id] = self.entries
+
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(data, f, indent=4)
+        except OSError as e:
+            print(f"Could not write parameter cache {self.path}: {e}")
+
 class LTRC_manager():
-    def __init__(self) -> None:
-        # Load configuration
-        if getattr(sys, 'frozen', False):
-            base_path = sys._MEIPASS
-        else:
-            base_path = os.path.dirname(os.path.abspath(__file__))
-            
-        config_path = os.path.join(base_path, "config.json")
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-            
+    def __init__(self, sheet=None) -> None:
+        '''
+        Args:
+            sheet: Optional spreadsheet to use instead of connecting to Google Sheets
+        '''
         # Get sheetname from config
-        self.sheetname = config['sheetname']
-
-        # Define the scope
-        scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/spreadsheets','https://www.googleapis.com/auth/drive.file','https://www.googleapis.com/auth/drive']
+        self.sheetname = ConfigService.get().sheetname
 
-        # Add your service account file
-        credentials_path = os.path.join(base_path, 'auto-mmr-calculator-9676e1429d9a.json')
-        creds = Credentials.from_service_account_file(credentials_path, scopes=scope)
+        if sheet is None:
+            # The client, spreadsheet key, metadata and access token are shared by every LTRC manager of the process
+            from sheetsconnection import SheetsConnection
+            sheet = SheetsConnection.open(self.sheetname)
 
-        # Authorize the clientsheet
-        client = gspread.authorize(creds)
+            # Keep the K and C values on disk, next to the executable when bundled
+            cache_path = os.path.join(get_data_path(), "parameters_cache.json")
+        else:
+            # Other backends only cache the K and C values in memory
+            cache_path = None
 
-        # Get the instance of the Spreadsheet
-        sheet = client.open(self.sheetname) 
+        self.sheet = sheet
+        self.parameter_cache = ParameterCache(cache_path, getattr(sheet, 'id', None))
 
         # Get the individual sheets of the Spreadsheet
-        # self.Team_Rankings_and_Personal_Evaluation = sheet.get_worksheet(0)
-        # self.Rules_and_Ranks = sheet.get_worksheet(1)
-        self.TR_Tables = sheet.get_worksheet(2)
-        self.Table_stuff = sheet.get_worksheet(3)
-        self.Playerdata = sheet.get_worksheet(4)
-        # self.Teamdata = sheet.get_worksheet(5)
-        self.Placements = sheet.get_worksheet(6)
+        self.load_worksheets()
 
         # Get the mode from the spreadsheet
         self.mode = self.Table_stuff.get("C1")[0][0] 
@@ -80,6 +522,36 @@ class LTRC_manager():
         # Toggle flag for 200cc mode
         self.flag_200cc = False
 
+    def load_worksheets(self, refresh=False):
+        '''
+        This method gets the individual sheets of the Spreadsheet. The spreadsheet handle is shared
+        and keeps its metadata, so a missing sheet makes it fetch the metadata again once.
+        
+        Args:
+            refresh: Fetch the metadata first, e.g. after tabs were renamed, moved or resized
+        '''
+        from gspread.exceptions import WorksheetNotFound
+
+        # Backends without a metadata cache always return the current sheets
+        can_refresh = hasattr(self.sheet, 'refresh_metadata')
+        if refresh and can_refresh:
+            self.sheet.refresh_metadata()
+
+        try:
+            # self.Team_Rankings_and_Personal_Evaluation = self.sheet.get_worksheet(0)
+            # self.Rules_and_Ranks = self.sheet.get_worksheet(1)
+            TR_Tables = self.sheet.get_worksheet(2)
+            Table_stuff = self.sheet.get_worksheet(3)
+            Playerdata = self.sheet.get_worksheet(4)
+            # self.Teamdata = self.sheet.get_worksheet(5)
+            Placements = self.sheet.get_worksheet(6)
+        except WorksheetNotFound:
+            if refresh or not can_refresh:
+                raise
+            return self.load_worksheets(refresh=True)
+
+        self.TR_Tables, self.Table_stuff, self.Playerdata, self.Placements = TR_Tables, Table_stuff, Playerdata, Placements
+
     def _update_progress(self, value, message=None):
         """Update the progress callback if provided"""
         if hasattr(self, 'progress_callback') and self.progress_callback and callable(self.progress_callback):
@@ -119,8 +591,11 @@ class LTRC_manager():
 
     def get_all(self):
         '''
-        This method reads all the required data from the spreadsheet using a single API call
+        This method reads all the required data from the spreadsheet.
+        Independent reads are sent concurrently, so they cost about one round trip together.
         '''
+        import numpy as np
+
         # Define range based on the mode
         match self.mode:
             case "FFA":
@@ -138,33 +613,47 @@ class LTRC_manager():
 
         self._update_progress(5, f"Retrieving {self.mode} tournament data from Google Sheets...")
         
-        # Get all data in a single API call
-        data = self.TR_Tables.get(range_str)
-        self._update_progress(15, "Extracting player names, scores and current MMR values...")
-        
-        # Process the data
-        self.racers = []
-        self.scores = []
-        self.MMRs = []
-        
-        for row in data:
-            # Only process rows with data
-            if row and len(row) >= 2 and row[0] != '':
-                self.racers.append(row[0])
-                # Convert scores to integers
-                self.scores.append(int(row[1]))
-                # Get MMR from column E (index 3)
-                if len(row) > 3:
-                    self.MMRs.append(row[3])
-                else:
-                    self.MMRs.append("???")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Send the table, Playerdata and Placements reads at the same time
+            table_future = executor.submit(self.TR_Tables.get, range_str)
+            index_future = executor.submit(PlayerIndex, self.Playerdata)
+            placements_future = executor.submit(self.Placements.get_all_values)
+            
+            data = table_future.result()
+            self._update_progress(15, "Extracting player names, scores and current MMR values...")
+            
+            # Process the data
+            self.racers = []
+            self.scores = []
+            self.MMRs = []
+            
+            for row in data:
+                # Only process rows with data
+                if row and len(row) >= 2 and row[0] != '':
+                    self.racers.append(row[0])
+                    # Convert scores to integers
+                    self.scores.append(int(row[1]))
+                    # Get MMR from column E (index 3)
+                    if len(row) > 3:
+                        self.MMRs.append(row[3])
+                    else:
+                        self.MMRs.append("???")
+
+            if len(self.racers) == 0:
+                raise ValueError("No racers found in the sheet")
+            
+            if len(self.racers) != len(self.scores) or len(self.racers) != len(self.MMRs):
+                raise ValueError("The number of racers, scores and MMRs do not match")
+            
+            # The K values depend on the room size, load them while the other reads finish
+            parameters_future = executor.submit(self.get_parameters)
+            
+            # Playerdata is read in full so player lookups are served from memory
+            self._update_progress(18, "Loading player database...")
+            self.player_index = index_future.result()
+            self.placements_data = placements_future.result()
+            parameters_future.result()
 
-        if len(self.racers) == 0:
-            raise ValueError("No racers found in the sheet")
-        
-        if len(self.racers) != len(self.scores) or len(self.racers) != len(self.MMRs):
-            raise ValueError("The number of racers, scores and MMRs do not match")
-        
         # Add any new players to the sheets
         self._update_progress(20, "Checking for new players and adding them to database...")
         self.handle_new_players()
@@ -181,40 +670,52 @@ class LTRC_manager():
         '''
         This method checks for new players and adds them to both Playerdata and Placements tabs
         '''
+        from gspread.utils import ValueInputOption
+
         new_players = []
         
         # Check each racer to see if they exist in the Playerdata sheet
         for racer in self.racers:
-            cell = self.Playerdata.find(racer, case_sensitive=False)
+            cell = self.player_index.find(racer)
             if cell is None:
                 # If the racer is not found, add them to the new_players list
                 new_players.append(racer)
         
         # If there are new players, add them to both sheets
         if new_players:
-            # Get all player names from Playerdata and Placements
-            playerdata_names = self.Playerdata.col_values(1)
-            placements_names = self.Placements.col_values(1)
-            
-            playerdata_row = len(playerdata_names) + 1  # First empty row
-            placements_row = len(placements_names) + 1  # First empty row
+            # Find the first empty row of Placements, Playerdata is already in the index
+            placements_row = 1
+            for row_idx, row in enumerate(self.placements_data, start=1):
+                if row and row[0]:
+                    placements_row = row_idx + 1
             
             # If Placements has header rows, adjust the start index
             if placements_row < 5:
                 placements_row = 5  # Start after header rows
             
+            # Collect all new rows and write them in a single API call
+            write_plan = WritePlan(self.sheet, ValueInputOption.user_entered)
+            
             for player in new_players:
                 # Add player to Playerdata
-                self.Playerdata.update_cell(playerdata_row, 1, player)  # Name
-                self.Playerdata.update_cell(playerdata_row, 4, "???")   # MMR
-                playerdata_row += 1
+                playerdata_row = self.player_index.next_row  # First empty row
+                write_plan.update_cell(self.Playerdata, playerdata_row, 1, player)  # Name
+                write_plan.update_cell(self.Playerdata, playerdata_row, 4, "???")   # MMR
+                self.player_index.append({1: player, 4: "???"})
                 
                 # Add player to Placements
-                self.Placements.update_cell(placements_row, 1, player)  # Name
-                self.Placements.update_cell(placements_row, 2, "")      # Completion
-                self.Placements.update_cell(placements_row, 8, "0")     # MMR Accumulation
+                write_plan.update_cell(self.Placements, placements_row, 1, player)  # Name
+                write_plan.update_cell(self.Placements, placements_row, 2, "")      # Completion
+                write_plan.update_cell(self.Placements, placements_row, 8, "0")     # MMR Accumulation
+                
+                # Keep the loaded Placements data in sync so it does not have to be read again
+                while len(self.placements_data) < placements_row:
+                    self.placements_data.append([])
+                self.placements_data[placements_row - 1] = [player, "", "", "", "", "", "", "0"]
                 placements_row += 1
             
+            write_plan.commit()
+            
             print(f"Added {len(new_players)} new player(s) to the sheets: {', '.join(new_players)}")
 
     def calculate_placement(self):
@@ -229,8 +730,8 @@ class LTRC_manager():
         self.placement_updates = []
         self.completion = []
 
-        # Get all placement data at once in a single API call
-        placements_data = self.Placements.get_all_values()[4:]  # Skip header rows
+        # Use the placement data loaded by get_all
+        placements_data = self.placements_data[4:]  # Skip header rows
         
         # Create a dictionary for quick lookups
         placements_dict = {}
@@ -251,9 +752,6 @@ class LTRC_manager():
         while empty_row < len(placements_data) + 5 and placements_data[empty_row - 5] and placements_data[empty_row - 5][0]:
             empty_row += 1
         
-        # Cache for playerdata lookups
-        playerdata_rows = {}
-        
         for i in range(num):
             # If the MMR is unknown
             if MMRs[i] == "???" or MMRs[i] == "":
@@ -310,37 +808,19 @@ class LTRC_manager():
                     self.placement_updates.append((row, 2, "1/3"))
                     self.placement_updates.append((row, 4, points[0]))
 
-                # Calculate the average number of points in the past event(s)
-                average = np.average(points)
-
-                # Calculate the MMR of the racer based on the average
-                for threshold, mmr in MMR_THRESHOLDS.items():
-                    if average < threshold:
-                        MMR = mmr
-                        break
-                else:
-                    MMR = 7750
-
+                previous_season_MMR = None
                 if racer in placements_dict and placements_dict[racer]['completion'] == "2/3":
                     # MMR is average with previous season MMR
-                    # Get the previous season MMR - use cache if available
-                    if racer in playerdata_rows:
-                        row_playerdata = playerdata_rows[racer]
-                    else:
-                        row_playerdata = self.Playerdata.find(racer, case_sensitive=False).row
-                        playerdata_rows[racer] = row_playerdata
-                    
-                    previous_season_MMR = self.Playerdata.cell(row_playerdata, 11).value
-
-                    if previous_season_MMR is not None and previous_season_MMR != "???":
-                        previous_season_MMR = int(previous_season_MMR)
-                        MMR = (MMR + previous_season_MMR) / 2
+                    # Get the previous season MMR from the player index
+                    row_playerdata = self.player_index.find(racer).row
+                    previous_season_MMR = self.player_index.value(row_playerdata, 11)
 
                 # Add previously gained MMR to the new MMR
+                mmr_accum = 0
                 if racer in placements_dict and placements_dict[racer]['mmr_accum']:
-                    MMR += int(placements_dict[racer]['mmr_accum'])
+                    mmr_accum = int(placements_dict[racer]['mmr_accum'])
                 
-                self.LR_list.append(MMR)
+                self.LR_list.append(placement_MMR(points, previous_season_MMR, mmr_accum))
             else:
                 self.is_placed.append(True)
                 self.completion.append("")
@@ -350,135 +830,98 @@ class LTRC_manager():
         '''
         This method finds the rankings of the racers, taking ties into account
         '''
-        
-        rankings = [1] # list holding the rankings of the racers
-
-        # get team scores depending on the mode
-        match self.mode:
-            case "FFA":
-                scores = self.scores
-            case "2vs2":
-                scores = [sum(self.scores[i:i+2]) for i in range(0, len(self.scores), 2)]
-            case "3vs3":
-                scores = [sum(self.scores[i:i+3]) for i in range(0, len(self.scores), 3)]
-            case "4vs4":
-                scores = [sum(self.scores[i:i+4]) for i in range(0, len(self.scores), 4)]
-            case "5vs5":
-                scores = [sum(self.scores[i:i+5]) for i in range(0, len(self.scores), 5)]
-            case "6vs6":
-                scores = [sum(self.scores[i:i+6]) for i in range(0, len(self.scores), 6)]
-
-        # Find the rankings of the racers/teams
-        for i in range(1,len(scores)):
-            if scores[i] == scores[i-1]:
-                rankings.append(rankings[i-1])
-            else:
-                rankings.append(i+1)
-
-        # Make the list the right size again
-        match self.mode:
-            case "FFA":
-                rankings = rankings
-            case "2vs2":
-                rankings = [rankings[i//2] for i in range(len(rankings)*2)]
-            case "3vs3":
-                rankings = [rankings[i//3] for i in range(len(rankings)*3)]
-            case "4vs4":
-                rankings = [rankings[i//4] for i in range(len(rankings)*4)]
-            case "5vs5":
-                rankings = [rankings[i//5] for i in range(len(rankings)*5)]
-            case "6vs6":
-                rankings = [rankings[i//6] for i in range(len(rankings)*6)]
-        
-        self.rankings = rankings   # Save the rankings of the race to the class     
+        # Save the rankings of the race to the class
+        self.rankings = rank_teams(self.scores, TEAM_SIZES[self.mode]).tolist()
 
-    def find_k_values(self):
+    def get_parameters(self):
         '''
-        This method makes a list of k values corresponding to the rankings of the racers and the mode
+        This method stores the mode and room size in Table_stuff and gets the K values
+        of the mode and the C value, from the parameter cache when possible
         '''
         # Insert the correct number of players into the sheet
         num_players = len(self.racers)
-        self.Table_stuff.update("C1", [[self.mode]])
-        self.Table_stuff.update("C2", [[num_players]])
+        self.Table_stuff.update("C1:C2", [[self.mode], [num_players]])
 
-        # Get the right k values depending on the mode
-        match self.mode:
-            case "FFA":
-                range_str = "E11:E22"
-            case "2vs2":
-                range_str = "F11:F16"
-            case "3vs3":
-                range_str = "G11:G14"
-            case "4vs4":
-                range_str = "H11:H13"
-            case "5vs5":
-                range_str = "I11:I12"
-            case "6vs6":
-                range_str = "I11:I12"
-                
-        k_list = self.Table_stuff.get(range_str)
+        entry = self.parameter_cache.get(self.mode, num_players)
+        if entry is None:
+            entry = self.read_parameters(self.mode, num_players)
+
+        self.k_list = entry['k']
+        self.C = entry['C']
+
+    def read_parameters(self, mode, num_players):
+        '''
+        This method reads the K values of the mode and the C value in a single API call
+        and stores them in the parameter cache. C1 and C2 must already hold the mode and room size.
+        
+        Args:
+            mode: The mode of the room
+            num_players: Number of racers in the room
+        
+        Returns:
+            dict: Dictionary with the K values of the mode under 'k' and the C value under 'C'
+        '''
+        k_list, C = self.Table_stuff.batch_get([K_RANGES[mode], "E1"])
         
         # Process k values
         # Flatten the list and convert strings to integers
         k_list = [int(value) for sublist in k_list for value in sublist]
+        return self.parameter_cache.store(mode, num_players, k_list, int(C[0][0]))
+
+    def load_parameters(self, mode, num_players):
+        '''
+        This method gets the K values and C value for a room without processing a room,
+        from the parameter cache when possible. Table_stuff is left as it was.
+        
+        Args:
+            mode: The mode of the room
+            num_players: Number of racers in the room
+        
+        Returns:
+            dict: Dictionary with the K values of the mode under 'k' and the C value under 'C'
+        '''
+        from gspread.utils import ValueInputOption, ValueRenderOption
+
+        entry = self.parameter_cache.get(mode, num_players)
+        if entry is None:
+            # The K table is filled in for the mode in C1 and the room size in C2,
+            # they are put back afterwards since no room is being processed
+            original = self.Table_stuff.get("C1:C2", value_render_option=ValueRenderOption.formula)
+            original = [[row[0] if row else ""] for row in (list(original) + [[], []])[:2]]
+
+            self.Table_stuff.update("C1:C2", [[mode], [num_players]])
+            try:
+                entry = self.read_parameters(mode, num_players)
+            finally:
+                self.Table_stuff.update("C1:C2", original, value_input_option=ValueInputOption.user_entered)
+        return entry
 
+    def find_k_values(self):
+        '''
+        This method makes a list of k values corresponding to the rankings of the racers and the mode
+        '''
         # k values corresponding to the rankings
         k_values = []
         for i in range(len(self.rankings)):
-            k_values.append(k_list[self.rankings[i]-1])     # -1 because the rankings start at 1 but the list starts at 0      
+            k_values.append(self.k_list[self.rankings[i]-1])     # -1 because the rankings start at 1 but the list starts at 0      
 
         self.k_values = k_values  # Save the k values to the class
         
     def calc_new_MMR(self):
-        C = int(self.Table_stuff.get("E1")[0][0]) # Get the C value from the spreadsheet
-        LR = self.LR_list
-        K = self.k_values
-        u = self.average_room_MMR
-        p_mu = 5800
+        C = self.C # The C value is loaded from the spreadsheet together with the K values
 
-        # list holding the change in MMR for each player
-        delta_MMRs = []
-
-        for i in range(len(LR)):
-            # The equation for the change in MMR
-            delta_MMRs.append(C/12 +  C/(1+11**(-(u-LR[i])/p_mu)) - K[i])
-
-        # Average MMR gain for the teams
-        match self.mode:
-            case "FFA":
-                self.delta_MMRs = delta_MMRs
-            case "2vs2":
-                delta_MMRs = [sum(delta_MMRs[i:i+2])/2 for i in range(0, len(delta_MMRs), 2)]
-                self.delta_MMRs = [delta_MMRs[i//2] for i in range(len(delta_MMRs)*2)]
-            case "3vs3":
-                delta_MMRs = [sum(delta_MMRs[i:i+3])/3 for i in range(0, len(delta_MMRs), 3)]
-                self.delta_MMRs = [delta_MMRs[i//3] for i in range(len(delta_MMRs)*3)]
-            case "4vs4":
-                delta_MMRs = [sum(delta_MMRs[i:i+4])/4 for i in range(0, len(delta_MMRs), 4)]
-                self.delta_MMRs = [delta_MMRs[i//4] for i in range(len(delta_MMRs)*4)]
-            case "5vs5":
-                delta_MMRs = [sum(delta_MMRs[i:i+5])/5 for i in range(0, len(delta_MMRs), 5)]
-                self.delta_MMRs = [delta_MMRs[i//5] for i in range(len(delta_MMRs)*5)]
-            case "6vs6":
-                delta_MMRs = [sum(delta_MMRs[i:i+6])/6 for i in range(0, len(delta_MMRs), 6)]
-                self.delta_MMRs = [delta_MMRs[i//6] for i in range(len(delta_MMRs)*6)]
-    
-        # Modify MMR if 32 track mode is enabled
-        if self.flag_32track:
-            self.delta_MMRs = [delta_MMR * 2.67 if delta_MMR > 0 else delta_MMR * 0.67 for delta_MMR in self.delta_MMRs]
-        
-        # Modify MMR if 200cc mode is enabled - halve losses only
-        if self.flag_200cc:
-            self.delta_MMRs = [delta_MMR if delta_MMR > 0 else delta_MMR * 0.5 for delta_MMR in self.delta_MMRs]
-        
-        # Round the MMR changes to the nearest integer
-        self.delta_MMRs = [int(round(delta_MMR)) for delta_MMR in self.delta_MMRs]
+        delta_MMRs, MMR_new = calculate_mmr_changes(
+            self.LR_list,
+            self.k_values,
+            C,
+            TEAM_SIZES[self.mode],
+            self.flag_32track,
+            self.flag_200cc
+        )
 
-        # Add the change in MMR to the old MMR
-        self.MMR_new = np.add(self.LR_list, self.delta_MMRs)
-        
-        # Round the new MMR values to integers
-        self.MMR_new = [int(round(mmr)) for mmr in self.MMR_new]
+        # Save the changes and new MMR values as plain integers
+        self.delta_MMRs = delta_MMRs.tolist()
+        self.MMR_new = MMR_new.tolist()
 
     def fill_MMR_change_table(self):
         '''
@@ -525,6 +968,8 @@ class LTRC_manager():
         '''
         This method fills the rank change table in the spreadsheet
         '''
+        import numpy as np
+
         # Dictionary holding the rank ranges
         rankings_dict = {0: "Tin", 1: "Tin", 2: "Bronze", 3: "Silver", 
                          4: "Gold", 5: "Emerald", 6: "Sapphire", 
@@ -620,23 +1065,28 @@ class LTRC_manager():
                 self.TR_Tables.update("I92:I105", [[rank_change] for rank_change in rank_changes_list])
                 self.TR_Tables.update("H92:H105", [[up_down] for up_down in up_down_list])
 
-    def update_sheet(self, progress_callback=None):
+    def create_write_plan(self):
+        '''
+        This method creates an empty write plan for this spreadsheet
+        
+        Returns:
+            WritePlan: Plan that collects changes until it is committed
+        '''
+        return WritePlan(self.sheet)
+
+    def update_sheet(self, progress_callback=None, write_plan=None):
         '''
         This method updates the MMRs of the players on the sheet
         
         Args:
             progress_callback: Function to report progress (percentage, message)
+            write_plan: Optional WritePlan to queue the changes in, otherwise they are written immediately
         '''
-        # First update placement data
-        placement_count = len(self.placement_updates)
+        plan = write_plan if write_plan is not None else self.create_write_plan()
         
-        # Batch update placements data to reduce API calls
-        if self.placement_updates:
-            cell_list = []
-            for idx, (row, column, value) in enumerate(self.placement_updates):
-                cell_list.append(gspread.cell.Cell(row, column, value))
-                # Execute the batch update
-                self.Placements.update_cells(cell_list)     
+        # Queue the placement data
+        for row, column, value in self.placement_updates:
+            plan.update_cell(self.Placements, row, column, value)
         
         # Count how many placed players we need to update
         placed_players = [i for i, is_placed in enumerate(self.is_placed) if is_placed]
@@ -647,30 +1097,35 @@ class LTRC_manager():
         
         for i in placed_players:
             # Get the row of the racer
-            row = self.Playerdata.find(self.racers[i], case_sensitive=False).row
+            row = self.player_index.find(self.racers[i]).row
             
             # Update the MMR of the racer
-            self.Playerdata.update_cell(row, 4, int(self.MMR_new[i]))
+            plan.update_cell(self.Playerdata, row, 4, int(self.MMR_new[i]))
+            self.player_index.set_value(row, 4, int(self.MMR_new[i]))
             
             # Update progress
             placed_processed += 1
             if progress_callback:
                 progress = 35 + int(55 * placed_processed / placed_count) if placed_count > 0 else 90
                 progress_callback(progress, f"Updating Playerdata sheet: {placed_processed}/{placed_count} players - {self.racers[i]}")
+        
+        # Write the changes if no plan was given
+        if write_plan is None:
+            plan.commit(progress_callback)
 
-    def update_placements_MMR(self, progress_callback=None):
+    def update_placements_MMR(self, progress_callback=None, write_plan=None):
         '''
         This method updates the MMR of the racers in the placements sheet
         
         Args:
             progress_callback: Function to report progress (percentage, message)
+            write_plan: Optional WritePlan to queue the changes in, otherwise they are written immediately
         '''
+        plan = write_plan if write_plan is not None else self.create_write_plan()
+        
         # Count how many unplaced players we have
         unplaced_count = sum(1 for is_placed in self.is_placed if not is_placed)
         
-        # Prepare batch update list
-        cell_updates = []
-        
         unplaced_processed = 0
         
         for i, completion in enumerate(self.completion):
@@ -684,8 +1139,8 @@ class LTRC_manager():
                 # Calculate the new accumulated MMR
                 new_mmr = old_mmr + int(self.delta_MMRs[i])
                 
-                # Add to batch update
-                cell_updates.append(gspread.cell.Cell(row, 8, new_mmr))
+                # Add to the write plan
+                plan.update_cell(self.Placements, row, 8, new_mmr)
                 
                 # Update progress
                 unplaced_processed += 1
@@ -693,17 +1148,20 @@ class LTRC_manager():
                     progress = int(25 * unplaced_processed / unplaced_count) if unplaced_count > 0 else 25
                     progress_callback(progress, f"Updating Placements sheet: {unplaced_processed}/{unplaced_count} players - {racer}")
         
-        # Execute the batch update if there are any updates to make
-        if cell_updates:
-            self.Placements.update_cells(cell_updates)
+        # Write the changes if no plan was given
+        if write_plan is None:
+            plan.commit(progress_callback)
 
-    def clear_table(self, progress_callback=None):
+    def clear_table(self, progress_callback=None, write_plan=None):
         '''
         This method clears the TR tables using batch_clear to reduce API calls
         
         Args:
             progress_callback: Function to report progress (percentage, message)
+            write_plan: Optional WritePlan to queue the changes in, otherwise they are written immediately
         '''
+        plan = write_plan if write_plan is not None else self.create_write_plan()
+        
         if progress_callback:
             progress_callback(90, "Clearing tournament tables...")
             
@@ -713,30 +1171,34 @@ class LTRC_manager():
         match self.mode:
             case "FFA":
                 ranges = ["B3:B14", "C3:C14", "F3:F14", "I3:I14"]
-                self.TR_Tables.update("H3:H14", [["-"] for _ in range(12)])
+                plan.update(self.TR_Tables, "H3:H14", [["-"] for _ in range(12)])
             case "2vs2":
                 ranges = ["B23:B39", "C23:C39", "F23:F39", "I23:I39"]
-                self.TR_Tables.update("H23:H39", [["-"] for _ in range(17)])
+                plan.update(self.TR_Tables, "H23:H39", [["-"] for _ in range(17)])
             case "3vs3":
                 ranges = ["B48:B62", "C48:C62", "F48:F62", "I48:I62"]
-                self.TR_Tables.update("H48:H62", [["-"] for _ in range(15)])
+                plan.update(self.TR_Tables, "H48:H62", [["-"] for _ in range(15)])
             case "4vs4":
                 ranges = ["B71:B84", "C71:C84", "F71:F84", "I71:I84"]
-                self.TR_Tables.update("H71:H84", [["-"] for _ in range(14)])
+                plan.update(self.TR_Tables, "H71:H84", [["-"] for _ in range(14)])
             case "5vs5":
                 ranges = ["B92:B104", "C92:C104", "F92:F104", "I92:I104"]
-                self.TR_Tables.update("H92:H104", [["-"] for _ in range(13)])
+                plan.update(self.TR_Tables, "H92:H104", [["-"] for _ in range(13)])
             case "6vs6":
                 ranges = ["B92:B104", "C92:C104", "F92:F104", "I92:I104"]
-                self.TR_Tables.update("H92:H104", [["-"] for _ in range(13)])
+                plan.update(self.TR_Tables, "H92:H104", [["-"] for _ in range(13)])
         
-        # Use batch_clear to clear all ranges in a single API call
+        # Clear all ranges together with the rest of the plan
         if ranges:
-            self.TR_Tables.batch_clear(ranges)
+            plan.clear(self.TR_Tables, ranges)
         
-        # Final progress update
-        if progress_callback:
-            progress_callback(100, "Sheet update complete!")
+        # Write the changes if no plan was given
+        if write_plan is None:
+            plan.commit(progress_callback)
+            
+            # Final progress update
+            if progress_callback:
+                progress_callback(100, "Sheet update complete!")
 
     def get_mii(self, player):
         """
@@ -748,8 +1210,10 @@ class LTRC_manager():
         Returns:
             str: URL to the player's Mii image or default Mii if not found
         """
+        from gspread.utils import ValueRenderOption
+
         # Find the player in the sheet and get their Mii
-        cell = self.Playerdata.find(player, case_sensitive=False)
+        cell = self.player_index.find(player)
         if cell and (mii := self.Playerdata.cell(cell.row, 5, value_render_option=ValueRenderOption.formula).value):
             formula = mii
         else:
@@ -772,6 +1236,8 @@ class LTRC_manager():
         Each dictionary contains: name, score, mmr_change, new_mmr, mii, completion
         Only fetches Mii images for the winning team to reduce API calls.
         """
+        from gspread.utils import ValueRenderOption
+
         # Make sure all the necessary calculations have been performed
         if not hasattr(self, 'racers') or not hasattr(self, 'scores') or not hasattr(self, 'delta_MMRs') or not hasattr(self, 'MMR_new'):
             raise ValueError("Data not fully initialized.")
@@ -798,6 +1264,7 @@ class LTRC_manager():
         
         # Get all Mii URLs in a batch for the winning team
         mii_urls = {}
+        default_mii_url = None
         if miis_to_fetch > 0:
             # Get player names from the winning team
             winning_team = self.racers[:miis_to_fetch]
@@ -805,7 +1272,7 @@ class LTRC_manager():
             # First, try to find the row numbers for these players
             rows = {}
             for player in winning_team:
-                cell = self.Playerdata.find(player, case_sensitive=False)
+                cell = self.player_index.find(player)
                 if cell:
                     rows[player] = cell.row
                 
@@ -845,7 +1312,6 @@ class LTRC_manager():
                                 mii_urls[player] = formula[start+1:end]
                 
                 # Extract default Mii URL
-                default_mii_url = None
                 if default_mii_formula and 'IMAGE' in default_mii_formula:
                     start = default_mii_formula.find('"')
                     end = default_mii_formula.rfind('"')
@@ -883,6 +1349,7 @@ class LTRC_manager():
                 "mmr_change": mmr_change,
                 "new_mmr": new_mmr,
                 "mii": mii_url,
+                "default_mii": default_mii_url if i < miis_to_fetch else None,
                 "completion": completion
             }
             
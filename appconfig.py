@@ -0,0 +1,310 @@
+import collections.abc
+import hashlib
+import json
+import os
+import sys
+import threading
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Optional, Tuple, get_args, get_origin
+
+'''
+Configuration service: config.json is loaded, validated and compiled once into
+immutable profiles that every part of the program shares.
+
+The file is only read again when its modification time changes, so asking for
+the configuration on every render costs a single stat call.
+'''
+
+def get_base_path():
+    """Get the base path for resource files, works for both development and PyInstaller"""
+    if getattr(sys, 'frozen', False):
+        # Running as a bundled executable
+        return sys._MEIPASS
+
+    # Running as a regular Python script
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_data_path():
+    """Get the folder for files that have to outlive the program, next to the executable when bundled"""
+    if getattr(sys, 'frozen', False):
+        # The bundle folder is temporary
+        return os.path.dirname(sys.executable)
+
+    return get_base_path()
+
+class HeaderProfile(NamedTuple):
+    title_y: int
+    title_size: int
+    title_color: str
+    subtitle_y: int
+    subtitle_size: int
+    subtitle_color: str
+    shadow_offset: Tuple[int, ...]
+
+class WinnerProfile(NamedTuple):
+    y_offset: int
+    font_size: int
+    spacing: int
+
+class MiiProfile(NamedTuple):
+    size: int
+    x_offset: int
+    y_offset: int
+    horizontal_spacing: int
+    bottom_spacing: int
+
+class PodiumStyle(NamedTuple):
+    start_x: int
+    start_y: int
+    medal_width: int
+    medal_height: int
+    position_x: int
+    position_offset_x: int
+    position_offset_y: int
+    position_size: int
+    name_size: int
+    name_color: str
+    stats_size: int
+    rank_change_icon_size: Tuple[int, ...]
+    icon_y_offset: int
+    row_spacing: int
+    winner: WinnerProfile
+    mii: MiiProfile
+    vertical_spacing: int
+    section_spacing: int
+    horizontal_spacing: int
+    center_x: int
+    position_sizes: Tuple[int, ...]
+    name_sizes: Tuple[int, ...]
+    stats_sizes: Tuple[int, ...]
+
+class RegularStyle(NamedTuple):
+    start_x: int
+    start_y: int
+    name_size: int
+    name_color: str
+    stats_size: int
+    row_spacing: int
+    horizontal_spacing: int
+    vertical_spacing: int
+    column_y_offset: int
+    column_spacing: int
+
+class FormatProfile(NamedTuple):
+    team_size: int
+    podium_count: int
+    header: HeaderProfile
+    podium_style: PodiumStyle
+    regular_style: RegularStyle
+    # Compiled from the sections above
+    mode: str = ""
+    mii: Optional[MiiProfile] = None
+    font_sizes: FrozenSet[int] = frozenset()
+    icon_sizes: FrozenSet[int] = frozenset()
+
+class ColorsProfile(NamedTuple):
+    gold: str
+    silver: str
+    bronze: str
+    mmr_up: str
+    mmr_down: str
+    icon: str
+    positions: Mapping[str, str]
+
+class ShadowProfile(NamedTuple):
+    color: Tuple[int, ...] = (0, 0, 0, 255)
+    blur_radius: float = 0
+
+class AppConfig(NamedTuple):
+    sheetname: str
+    style: str
+    width: int
+    height: int
+    font_file: str
+    background_color: str
+    background_image: str
+    colors: ColorsProfile
+    base_font_size: int = 20
+    rank_icons_dir: str = "rank_icons"
+    mii_cache_dir: Optional[str] = "mii_cache"
+    mii_cache_max_mb: float = 50
+    mii_cache_max_age_hours: float = 24
+    shadow: ShadowProfile = ShadowProfile()
+    # Compiled from the sections above
+    formats: Mapping[str, FormatProfile] = MappingProxyType({})
+    font_sizes: FrozenSet[int] = frozenset()
+    digest: str = ""
+
+# Fields of the profiles that are compiled instead of read from the file
+COMPILED_FIELDS = {
+    FormatProfile: {"mode", "mii", "font_sizes", "icon_sizes"},
+    AppConfig: {"formats", "font_sizes", "digest"},
+}
+
+def _convert(kind, value, path):
+    '''
+    Check a value from the file against the type of its field and convert it to an immutable value
+    '''
+    origin = get_origin(kind)
+
+    if origin is None and hasattr(kind, '_fields'):
+        return _compile(kind, value, path)
+
+    if origin is tuple:
+        if not isinstance(value, list):
+            raise RuntimeError(f"Setting {path} in config.json must be a list")
+        item_kind = get_args(kind)[0]
+        return tuple(_convert(item_kind, item, f"{path}[{i}]") for i, item in enumerate(value))
+
+    if origin is collections.abc.Mapping:
+        if not isinstance(value, dict):
+            raise RuntimeError(f"Setting {path} in config.json must be an object")
+        value_kind = get_args(kind)[1]
+        return MappingProxyType({key: _convert(value_kind, item, f"{path}.{key}") for key, item in value.items()})
+
+    if kind is Optional[str]:
+        kind = str if value is not None else type(None)
+
+    if kind is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif kind is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, kind)
+    if not valid:
+        raise RuntimeError(f"Setting {path} in config.json must be of type {kind.__name__}, not {type(value).__name__}")
+    return value
+
+def _compile(cls, data, path, **compiled):
+    '''
+    Build a profile from a section of the file, checking that every setting is present and valid
+
+    Args:
+        cls: The profile class
+        data: The section of the file
+        path: Location of the section, used in error messages
+        compiled: Values of the compiled fields
+
+    Returns:
+        The profile
+    '''
+    if not isinstance(data, dict):
+        raise RuntimeError(f"Setting {path} in config.json must be an object")
+
+    values = {}
+    for name, kind in cls.__annotations__.items():
+        if name in COMPILED_FIELDS.get(cls, ()):
+            if name in compiled:
+                values[name] = compiled[name]
+            continue
+
+        key_path = f"{path}.{name}" if path else name
+        if name not in data:
+            if name in cls._field_defaults:
+                continue
+            raise RuntimeError(f"Setting {key_path} is missing from config.json")
+        values[name] = _convert(kind, data[name], key_path)
+
+    return cls(**values)
+
+def _compile_format(mode, data):
+    '''
+    Compile the profile of a single format, collecting the font and icon sizes it draws with
+    '''
+    profile = _compile(FormatProfile, data, f"formats.{mode}", mode=mode)
+    header, podium_style, regular_style = profile.header, profile.podium_style, profile.regular_style
+
+    if len(podium_style.position_sizes) < profile.podium_count:
+        raise RuntimeError(f"Setting formats.{mode}.podium_style.position_sizes needs a size for each of the {profile.podium_count} podium places")
+
+    font_sizes = {header.title_size, header.subtitle_size,
+                  podium_style.position_size, podium_style.name_size, podium_style.stats_size,
+                  podium_style.winner.font_size, regular_style.name_size, regular_style.stats_size}
+    font_sizes.update(podium_style.position_sizes + podium_style.name_sizes + podium_style.stats_sizes)
+    icon_sizes = {podium_style.stats_size, regular_style.stats_size, *podium_style.stats_sizes}
+
+    return profile._replace(mii=podium_style.mii, font_sizes=frozenset(font_sizes), icon_sizes=frozenset(icon_sizes))
+
+def load_config(path):
+    '''
+    Load, validate and compile a configuration file, resolving its paths
+
+    Args:
+        path: Path to config.json
+
+    Returns:
+        AppConfig: The compiled configuration
+    '''
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+    except (OSError, json.JSONDecodeError) as e:
+        raise RuntimeError(f"Failed to load config. Please check config.json file at {path}: {e}")
+
+    formats = data.get('formats')
+    if not isinstance(formats, dict) or not formats:
+        raise RuntimeError("Setting formats is missing from config.json")
+    profiles = {mode: _compile_format(mode, format_data) for mode, format_data in formats.items()}
+
+    config = _compile(AppConfig, data, "")
+
+    # Resources are bundled with the program, the Mii cache is kept outside of the bundle
+    base_path = get_base_path()
+    config = config._replace(
+        style=os.path.join(base_path, config.style),
+        font_file=os.path.join(base_path, config.font_file),
+        background_image=os.path.join(base_path, config.background_image),
+        rank_icons_dir=os.path.join(base_path, config.rank_icons_dir),
+        mii_cache_dir=os.path.join(get_data_path(), config.mii_cache_dir) if config.mii_cache_dir else None,
+        formats=MappingProxyType(profiles),
+        font_sizes=frozenset().union(*(profile.font_sizes for profile in profiles.values())),
+        # Everything the image depends on, so caches can compare configurations without walking them
+        digest=hashlib.sha256(raw + base_path.encode('utf-8')).hexdigest(),
+    )
+
+    return config
+
+class ConfigService():
+    """
+    Process-wide access to the compiled configuration, reloaded when config.json changes on disk
+    """
+    path = os.path.join(get_base_path(), "config.json")
+    _config = None
+    _mtime = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        """
+        Get the compiled configuration
+
+        Returns:
+            AppConfig: The configuration
+        """
+        try:
+            mtime = os.stat(cls.path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with cls._lock:
+            if cls._config is None or mtime != cls._mtime:
+                cls._config = load_config(cls.path)
+                cls._mtime = mtime
+            return cls._config
+
+    @classmethod
+    def profile(cls, mode):
+        """
+        Get the compiled image profile of a format
+
+        Args:
+            mode: The format, e.g. "FFA" or "2vs2"
+
+        Returns:
+            FormatProfile: The profile
+        """
+        formats = cls.get().formats
+        if mode not in formats:
+            raise RuntimeError(f"No image profile for format {mode} in config.json")
+        return formats[mode]
@@ -0,0 +1,430 @@
+import argparse
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import random
+
+from MMR import LTRC_manager, TEAM_SIZES, calculate_mmr_changes, rank_teams
+from fakesheets import MODE_LAYOUT, create_ltrc_spreadsheet
+from replay import SeasonReplay
+
+# Import time budgets of the entry points in milliseconds, measured with -X importtime
+IMPORT_BUDGETS = {"main": 250, "ltrc": 100, "replay": 300}
+
+# Modules every entry point has to leave for the stage that first needs them
+HEAVY_MODULES = ("gspread", "google.oauth2", "numpy", "PIL", "requests", "PyQt6")
+IMPORT_ALLOWED = {"main": ("PyQt6",), "ltrc": (), "replay": ("numpy",)}
+
+def bench_placement_writes(sizes=(1, 12, 100, 1000)):
+    """
+    Check that placement writes in update_sheet always cost a single API call
+
+    Args:
+        sizes: Numbers of placement updates to benchmark
+
+    Returns:
+        bool: True if every size stayed at one call
+    """
+    ok = True
+
+    for size in sizes:
+        spreadsheet = create_ltrc_spreadsheet()
+        LTRC = LTRC_manager(spreadsheet)
+        spreadsheet.reset_stats()
+
+        # A room of unplaced racers only produces placement updates
+        LTRC.racers = [f"Racer {i}" for i in range(size)]
+        LTRC.is_placed = [False] * size
+        LTRC.placement_updates = [(5 + i, 2, "1/3") for i in range(size)]
+
+        write_plan = LTRC.create_write_plan()
+        start = time.perf_counter()
+        LTRC.update_sheet(write_plan=write_plan)
+        write_plan.commit()
+        elapsed = time.perf_counter() - start
+
+        print(f"placement writes n={size:<5} calls={write_plan.calls_made} "
+              f"cells={write_plan.cells_sent} time={elapsed * 1000:.2f}ms")
+
+        if write_plan.calls_made != 1 or spreadsheet.calls != 1 or write_plan.cells_sent != size:
+            print(f"  FAIL: expected 1 call and {size} cells")
+            ok = False
+
+    return ok
+
+def bench_rating_engine(rooms=10000):
+    """
+    Time rank_teams and calculate_mmr_changes over many generated rooms
+
+    Args:
+        rooms: Number of rooms to rate per mode
+    """
+    rng = random.Random(0)
+    print()
+
+    for mode, team_size in TEAM_SIZES.items():
+        num_players = 10 if mode == "5vs5" else 12
+        room_data = []
+        for _ in range(rooms):
+            scores = sorted((rng.randint(20, 120) for _ in range(num_players)), reverse=True)
+            LR = [rng.randint(1000, 12000) for _ in range(num_players)]
+            room_data.append((scores, LR))
+
+        start = time.perf_counter()
+        for scores, LR in room_data:
+            rankings = rank_teams(scores, team_size)
+            calculate_mmr_changes(LR, 500 + 50 * rankings, 1200, team_size)
+        elapsed = time.perf_counter() - start
+
+        print(f"rating engine {mode:<5} rooms={rooms} time={elapsed * 1000:.1f}ms "
+              f"({elapsed / rooms * 1e6:.1f}us per room)")
+
+def _baseline_rating(scores, LR, k_list, C, team_size, flag_32track=False, flag_200cc=False):
+    """
+    The per-racer rating loops LTRC_manager used before the vectorized engine, trimmed to the room
+    """
+    # Team scores, a short last team sums the racers it has
+    team_scores = [sum(scores[i:i+team_size]) for i in range(0, len(scores), team_size)]
+    rankings = [1]
+    for i in range(1, len(team_scores)):
+        rankings.append(rankings[i-1] if team_scores[i] == team_scores[i-1] else i+1)
+    rankings = [rankings[i//team_size] for i in range(len(rankings)*team_size)][:len(scores)]
+    K = [k_list[ranking-1] for ranking in rankings]
+
+    u = sum(LR) / len(LR)
+    delta_MMRs = [C/12 + C/(1+11**(-(u-LR[i])/5800)) - K[i] for i in range(len(LR))]
+    delta_MMRs = [sum(delta_MMRs[i:i+team_size])/team_size for i in range(0, len(delta_MMRs), team_size)]
+    delta_MMRs = [delta_MMRs[i//team_size] for i in range(len(delta_MMRs)*team_size)][:len(LR)]
+
+    if flag_32track:
+        delta_MMRs = [delta_MMR * 2.67 if delta_MMR > 0 else delta_MMR * 0.67 for delta_MMR in delta_MMRs]
+    if flag_200cc:
+        delta_MMRs = [delta_MMR if delta_MMR > 0 else delta_MMR * 0.5 for delta_MMR in delta_MMRs]
+    delta_MMRs = [int(round(delta_MMR)) for delta_MMR in delta_MMRs]
+
+    return rankings, delta_MMRs, [int(round(LR[i] + delta_MMRs[i])) for i in range(len(LR))]
+
+def check_partial_teams(rooms=2000):
+    """
+    Check that rooms with a short last team, e.g. 11 racers in 2vs2 after a disconnect,
+    are rated like the baseline rating loops did
+
+    Args:
+        rooms: Number of rooms to check per mode
+
+    Returns:
+        bool: True if every room matched
+    """
+    rng = random.Random(0)
+    ok = True
+
+    for mode, team_size in TEAM_SIZES.items():
+        if team_size == 1:
+            continue
+
+        mismatches = 0
+        for _ in range(rooms):
+            num_players = rng.choice([n for n in range(team_size + 1, 13) if n % team_size])
+            scores = sorted((rng.randint(20, 120) for _ in range(num_players)), reverse=True)
+            LR = [rng.randint(1000, 12000) for _ in range(num_players)]
+            k_list = [500 + 50 * rank for rank in range(12)]
+            flags = (rng.random() < 0.3, rng.random() < 0.3)
+
+            expected = _baseline_rating(scores, LR, k_list, 1200, team_size, *flags)
+            rankings = rank_teams(scores, team_size)
+            delta_MMRs, MMR_new = calculate_mmr_changes(LR, [k_list[ranking - 1] for ranking in rankings],
+                                                        1200, team_size, *flags)
+            if (rankings.tolist(), delta_MMRs.tolist(), MMR_new.tolist()) != expected:
+                mismatches += 1
+
+        print(f"partial teams {mode:<5} rooms={rooms} mismatches={mismatches}")
+        if mismatches:
+            print("  FAIL: expected the baseline rankings and MMR changes")
+            ok = False
+
+    return ok
+
+def bench_replay(num_events=5000):
+    """
+    Replay a generated season against a fake sheet and write the final ratings back
+
+    Args:
+        num_events: Number of events in the season
+    """
+    rng = random.Random(0)
+    spreadsheet = create_ltrc_spreadsheet()
+    LTRC = LTRC_manager(spreadsheet)
+    replay = SeasonReplay.from_sheet(LTRC)
+    roster = [player['name'] for player in replay.players.values()]
+
+    events = []
+    for _ in range(num_events):
+        mode = rng.choice(list(TEAM_SIZES))
+        num_players = 10 if mode == "5vs5" else 12
+        scores = sorted((rng.randint(20, 120) for _ in range(num_players)), reverse=True)
+        events.append({"mode": mode, "racers": rng.sample(roster, num_players), "scores": scores})
+
+    spreadsheet.reset_stats()
+    start = time.perf_counter()
+    replay.run(events)
+    replayed = time.perf_counter() - start
+    write_plan = replay.write(LTRC)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nseason replay events={num_events} players={len(replay.results())} "
+          f"replay={replayed * 1000:.0f}ms total={elapsed * 1000:.0f}ms "
+          f"calls={spreadsheet.calls} write calls={write_plan.calls_made} cells={write_plan.cells_sent}")
+
+def _legacy_shadow_composite(background, content, shadow_offset):
+    """
+    The compositing path generate used before the shadow was built from the content alpha
+    """
+    from PIL import Image
+
+    shadow = Image.new('RGBA', content.size, (0, 0, 0, 0))
+    shadow.paste((0, 0, 0), (0, 0), content.split()[3])
+
+    combined = Image.new('RGBA', (content.width + abs(shadow_offset[0]), content.height + abs(shadow_offset[1])), (0, 0, 0, 0))
+    combined.paste(shadow, (max(0, shadow_offset[0]), max(0, shadow_offset[1])), shadow.split()[3])
+    combined.paste(content, (max(0, -shadow_offset[0]), max(0, -shadow_offset[1])), content.split()[3])
+
+    final_img = Image.new('RGBA', background.size, (0, 0, 0, 0))
+    final_img.paste(background, (0, 0))
+    final_img.paste(combined, ((background.width - combined.width) // 2, (background.height - combined.height) // 2), combined)
+    return final_img
+
+def _shadow_run(variant, repeats):
+    """
+    Time one compositing path and measure the peak memory of the process.
+    Runs in a fresh process so the peak of one path does not hide the other.
+    """
+    from PIL import Image, ImageDraw
+    from appconfig import ConfigService
+    from imagegen import BackgroundCache, LTRCImageGenerator
+
+    config = ConfigService.get()._replace(mii_cache_dir=None)
+    if variant == "alpha":
+        config = config._replace(shadow=config.shadow._replace(blur_radius=0))
+
+    generator = LTRCImageGenerator("FFA", config)
+    size = (generator.width, generator.height)
+    shadow_offset = generator.header_config.shadow_offset
+
+    # Content spread over the canvas like a results table
+    rng = random.Random(0)
+    content = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(content)
+    for _ in range(300):
+        x, y = rng.randrange(50, size[0] - 250), rng.randrange(50, size[1] - 60)
+        draw.rectangle((x, y, x + rng.randint(20, 200), y + rng.randint(10, 40)), fill=(255, 255, 255, 255))
+    background = BackgroundCache.get(config.background_image, size, config.background_color).convert('RGB')
+
+    if variant == "legacy":
+        def run():
+            return _legacy_shadow_composite(background, content, shadow_offset)
+    else:
+        def run():
+            return generator._composite_with_shadow(generator._create_base_image(), content, shadow_offset)
+
+    # Both paths do the same setup, so the peak of the process after the first run compares them
+    peak = None
+    run()
+    try:
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS and KiB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        pass
+
+    allocations = Image.core.get_stats()['new_count']
+    run()
+    allocations = Image.core.get_stats()['new_count'] - allocations
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times), allocations, peak
+
+def bench_shadow(repeats=10):
+    """
+    Compare the old shadow compositing with the alpha based path, with the blur of
+    config.json as the production case and without blur for reference
+
+    Args:
+        repeats: Number of timed runs per path
+
+    Returns:
+        bool: True if the alpha based path with the configured blur is faster and uses less peak memory
+    """
+    print()
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for variant, label in [("legacy", "old paste path"), ("blur", "alpha, configured blur"), ("alpha", "alpha, no blur")]:
+        with context.Pool(1) as pool:
+            results[variant] = pool.apply(_shadow_run, (variant, repeats))
+        elapsed, allocations, peak = results[variant]
+        peak = f"{peak / 1024 ** 2:.1f}MB" if peak is not None else "n/a"
+        print(f"shadow {label:<22} time={elapsed * 1000:.1f}ms images allocated={allocations} peak RSS={peak}")
+
+    legacy, blur = results["legacy"], results["blur"]
+    print(f"shadow speedup with the configured blur: {legacy[0] / blur[0]:.2f}x")
+    ok = blur[0] < legacy[0] and (blur[2] is None or blur[2] < legacy[2])
+    if not ok:
+        print("  FAIL: the alpha based shadow with the configured blur is not cheaper than the old path")
+    return ok
+
+def _import_time(module):
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        Tuple of the cumulative import time of the module in seconds and the names of all imported modules
+    """
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=base_path, capture_output=True, text=True, check=True).stderr
+
+    # Lines look like "import time:  self [us] | cumulative | name", nested imports are indented
+    total = None
+    imported = set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        if name.rstrip() == f" {module}":
+            total = int(cumulative) / 1e6
+
+    return total, imported
+
+def bench_imports(budgets=IMPORT_BUDGETS, repeats=5):
+    """
+    Measure the import time of every entry point and check that no heavy library is loaded early
+
+    Args:
+        budgets: Import time budget in milliseconds by entry point module
+        repeats: Number of fresh interpreters per entry point, the median is reported
+
+    Returns:
+        bool: True if every entry point stayed within its budget and only imported the heavy libraries it is allowed to
+    """
+    print()
+    ok = True
+    for module, budget in budgets.items():
+        # The first run also writes the bytecode caches, it is not counted
+        _import_time(module)
+        runs = [_import_time(module) for _ in range(repeats)]
+        elapsed = statistics.median(total for total, _ in runs)
+        imported = runs[0][1]
+
+        early = [heavy for heavy in HEAVY_MODULES
+                 if heavy not in IMPORT_ALLOWED.get(module, ()) and heavy in imported]
+        print(f"import {module:<8} time={elapsed * 1000:.1f}ms budget={budget}ms "
+              f"heavy={','.join(heavy for heavy in HEAVY_MODULES if heavy in imported) or '-'}")
+
+        if elapsed * 1000 > budget:
+            print(f"  FAIL: over the import time budget of {budget}ms")
+            ok = False
+        if early:
+            print(f"  FAIL: imports {', '.join(early)} before they are needed")
+            ok = False
+
+    return ok
+
+def _measure(spreadsheet, stage, function):
+    """
+    Run one pipeline stage and return its result and its round trips, cells moved and wall time
+    """
+    spreadsheet.reset_stats()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    return result, {
+        "stage": stage,
+        "calls": spreadsheet.calls,
+        "cells": spreadsheet.cells_read + spreadsheet.cells_written,
+        "time": elapsed,
+    }
+
+def bench_pipeline(modes=tuple(MODE_LAYOUT), latency=0.0):
+    """
+    Run LTRC_routine, fill_*_table and the Write step for every mode against a fake sheet
+
+    Args:
+        modes: Modes to benchmark
+        latency: Seconds every API call is delayed by
+
+    Returns:
+        bool: True if every mode ran through
+    """
+    # Imported here so the placement benchmark does not need the imaging dependencies
+    from model import LTRCModel
+
+    print(f"\npipeline (latency={latency * 1000:.0f}ms per call)")
+    print(f"{'mode':<6} {'stage':<14} {'calls':>6} {'cells':>7} {'time':>10}")
+
+    ok = True
+    for mode in modes:
+        spreadsheet = create_ltrc_spreadsheet(mode, latency=latency)
+        stats = []
+        try:
+            # The model connects in the background, the stage lasts until the connection is ready
+            def connect():
+                model = LTRCModel(spreadsheet)
+                model.connection.result()
+                return model
+            model, stat = _measure(spreadsheet, "connect", connect)
+            stats.append(stat)
+            model.set_mode(mode)
+            for stage, function in [("LTRC_routine", model.get_table_data),
+                                    ("fill tables", model.write_table),
+                                    ("get_results", model.LTRC.get_results),
+                                    ("update_sheet", model.update_sheet)]:
+                _, stat = _measure(spreadsheet, stage, function)
+                stats.append(stat)
+        except Exception as e:
+            print(f"{mode:<6} FAIL: {type(e).__name__}: {e}")
+            ok = False
+            continue
+
+        for stat in stats:
+            print(f"{mode:<6} {stat['stage']:<14} {stat['calls']:>6} {stat['cells']:>7} {stat['time'] * 1000:>8.2f}ms")
+        total_calls = sum(stat['calls'] for stat in stats)
+        total_cells = sum(stat['cells'] for stat in stats)
+        total_time = sum(stat['time'] for stat in stats)
+        print(f"{mode:<6} {'total':<14} {total_calls:>6} {total_cells:>7} {total_time * 1000:>8.2f}ms")
+
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LTRC pipeline against a fake spreadsheet")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per API call in milliseconds")
+    parser.add_argument("--import-budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Override the import time budget of an entry point, e.g. main=400")
+    args = parser.parse_args()
+
+    budgets = dict(IMPORT_BUDGETS)
+    for override in args.import_budget:
+        module, _, budget = override.partition("=")
+        budgets[module] = float(budget)
+
+    ok = bench_imports(budgets)
+    ok = bench_placement_writes() and ok
+    bench_rating_engine()
+    ok = check_partial_teams() and ok
+    bench_replay()
+    ok = bench_shadow() and ok
+    ok = bench_pipeline(latency=args.latency / 1000) and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
-from PyQt6.QtCore import QTimer, QThread, pyqtSignal, Qt
-from PyQt6.QtGui import QImage, QPixmap, QClipboard
+from PyQt6.QtCore import QTimer, QThread, pyqtSignal, QMimeData
 from PyQt6.QtWidgets import QApplication, QFileDialog
 import os
 from datetime import datetime
-from PIL.ImageQt import ImageQt
+from view import pil_to_pixmap
+from exporter import EXPORT_FORMATS, DEFAULT_EXPORT_FORMAT
 
 class ImageGeneratorThread(QThread):
     # Define signals for progress updates and completion
@@ -21,31 +21,68 @@ class ImageGeneratorThread(QThread):
             self.progress_updated.emit(value, message)
         
         # Generate custom title based on enabled options
-        custom_title = self.create_custom_title()
+        custom_title = self.model.custom_title()
             
         pil_image = self.model.generate_image(self.subtitle, progress_callback, custom_title)
         self.image_generated.emit(pil_image)
+
+class PreviewThread(QThread):
+    # Signal with the request id and the preview PIL image
+    preview_ready = pyqtSignal(int, object)
+    
+    def __init__(self, model, request_id, subtitle, custom_title):
+        super().__init__()
+        self.model = model
+        self.request_id = request_id
+        self.subtitle = subtitle
+        self.custom_title = custom_title
         
-    def create_custom_title(self):
-        """Create a custom title based on enabled options"""
-        # Get the current mode from the model
-        format_type = self.model.LTRC.mode
-        title_parts = []
+    def run(self):
+        from imagegen import RenderCancelled
         
-        if self.model.flag_32track:
-            title_parts.append("32 Track")
-            
-        if self.model.flag_200cc:
-            title_parts.append("200cc")
-            
-        if self.model.flag_ott:
-            title_parts.append("OTT")
-            
-        # Add the format type and "Results"
-        title_parts.append(f"{format_type} Results")
+        # A newer request may have arrived while this one was waiting to start
+        if self.isInterruptionRequested():
+            return
+        
+        try:
+            # The render stops between its steps once a newer request interrupts it
+            pil_image = self.model.generate_preview(self.subtitle, self.custom_title,
+                                                    cancelled=self.isInterruptionRequested)
+        except RenderCancelled:
+            return
+        except Exception as e:
+            print(f"Could not render the preview: {e}")
+            return
+        
+        # Results of cancelled requests are dropped
+        if not self.isInterruptionRequested():
+            self.preview_ready.emit(self.request_id, pil_image)
+
+class ExportThread(QThread):
+    # Signals with the encoded image and the saved file path, or the error message
+    export_done = pyqtSignal(object, str)
+    export_failed = pyqtSignal(str)
+    
+    def __init__(self, model, export_format, filepath=None):
+        super().__init__()
+        self.model = model
+        self.export_format = export_format
+        self.filepath = filepath
+        
+    def run(self):
+        # Encoding and writing the file both happen off the GUI thread
+        try:
+            encoded = self.model.export_image(self.export_format)
+            if encoded is None:
+                self.export_failed.emit("No image has been generated yet")
+                return
+            filepath = encoded.save(self.filepath) if self.filepath else ""
+        except Exception as e:
+            print(f"Could not export the image: {e}")
+            self.export_failed.emit(str(e))
+            return
         
-        # Join all parts with spaces
-        return " ".join(title_parts)
+        self.export_done.emit(encoded, filepath)
 
 class SheetUpdateThread(QThread):
     # Define signals for progress updates and completion
@@ -65,10 +102,29 @@ class SheetUpdateThread(QThread):
         self.model.update_sheet(progress_callback)
         self.update_completed.emit()
 
+class ConnectionThread(QThread):
+    # Signals for the end of the background connection to the sheet
+    connection_ready = pyqtSignal()
+    connection_failed = pyqtSignal(str)
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        
+    def run(self):
+        # Only waits, the connection itself runs in the background task of the model
+        try:
+            self.model.connection.result()
+        except Exception as e:
+            self.connection_failed.emit(str(e))
+            return
+        self.connection_ready.emit()
+
 class TableDataThread(QThread):
     # Define signals for progress updates and completion
     progress_updated = pyqtSignal(int, str)
     data_loaded = pyqtSignal(object)
+    connection_failed = pyqtSignal(str)
     
     def __init__(self, model, mode):
         super().__init__()
@@ -79,6 +135,15 @@ class TableDataThread(QThread):
         # Define a progress callback function to pass to the get_table_data method
         def progress_callback(value, message):
             self.progress_updated.emit(value, message)
+        
+        # Wait for the connection started at launch, if it is not ready yet
+        if not self.model.is_connected():
+            progress_callback(0, "Connecting to Google Sheets...")
+            try:
+                self.model.connection.result()
+            except Exception as e:
+                self.connection_failed.emit(str(e))
+                return
             
         # Set the mode first
         self.model.set_mode(self.mode)
@@ -90,14 +155,34 @@ class TableDataThread(QThread):
         self.data_loaded.emit(table_data)
 
 class LTRCController:
+    # Milliseconds to wait after the last subtitle edit before rendering a preview
+    PREVIEW_DELAY = 250
+    
     def __init__(self, model, view):
         self.model = model
         self.view = view
+        
+        # Live preview state: only the latest request is rendered, one at a time
+        self.preview_timer = QTimer()
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self.start_preview)
+        self.preview_request_id = 0
+        self.preview_thread = None
+        self.preview_pending = False
+        
+        # Running export threads, kept referenced until they finish
+        self.export_threads = set()
+        
+        # Show the state of the connection started by the model at launch
+        self.connection_thread = None
+        self.watch_connection()
 
         self.view.start_button.clicked.connect(self.show_table_screen)
         self.view.cb_32track.toggled.connect(self.toggle_32track)
         self.view.cb_200cc.toggled.connect(self.toggle_200cc)
         self.view.cb_ott.toggled.connect(self.toggle_ott)
+        self.view.refresh_parameters_button.clicked.connect(self.refresh_parameters)
 
     def restart(self):
         # Store checkbox states before restart
@@ -111,18 +196,51 @@ class LTRCController:
         self.view.cb_32track.toggled.connect(self.toggle_32track)
         self.view.cb_200cc.toggled.connect(self.toggle_200cc)
         self.view.cb_ott.toggled.connect(self.toggle_ott)
+        self.view.refresh_parameters_button.clicked.connect(self.refresh_parameters)
+        self.watch_connection()
+
+    def watch_connection(self):
+        """Show the connection state on the main screen and update it once the connection finishes"""
+        if self.model.is_connected():
+            self.on_connection_ready()
+            return
+        if self.model.connection_failed():
+            self.on_connection_failed(str(self.model.connection.exception()))
+            return
+        
+        self.view.show_connection_status("Connecting to Google Sheets...")
+        if self.connection_thread is None or not self.connection_thread.isRunning():
+            self.connection_thread = ConnectionThread(self.model)
+            self.connection_thread.connection_ready.connect(self.on_connection_ready)
+            self.connection_thread.connection_failed.connect(self.on_connection_failed)
+            self.connection_thread.start()
+
+    def on_connection_ready(self):
+        self.view.show_connection_status("Connected to Google Sheets")
+
+    def on_connection_failed(self, message):
+        self.view.show_connection_status(f"Could not connect to Google Sheets: {message}\nPress Start to try again.")
 
     def show_table_screen(self):
         mode = self.view.dropdown.currentText()
         
+        # Try again if the connection at launch failed
+        if self.model.connection_failed():
+            self.model.connect()
+        
         # Show loading screen
         self.view.show_loading_screen(f"Loading {mode} Tournament Data...")
         
-        # Create and start a worker thread for data loading
+        # Create and start a worker thread for data loading, it only waits if the connection is not ready yet
         self.data_thread = TableDataThread(self.model, mode)
         self.data_thread.progress_updated.connect(self.view.update_progress)
         self.data_thread.data_loaded.connect(self.on_data_loaded)
+        self.data_thread.connection_failed.connect(self.on_table_connection_failed)
         self.data_thread.start()
+
+    def on_table_connection_failed(self, message):
+        # Back to the main screen, which shows the error
+        self.restart()
     
     def on_data_loaded(self, table_data):
         # Show the table screen with the loaded data
@@ -139,8 +257,64 @@ class LTRCController:
         self.view.skip_button.clicked.connect(self.show_write_screen)
         self.view.generate_button.clicked.connect(self.start_image_generation)
         self.view.discord_button.clicked.connect(self.start_image_generation_with_discord)
+        
+        # Re-render the preview as the subtitle is typed, starting with the empty subtitle
+        self.view.subtitle_input.textChanged.connect(self.schedule_preview)
+        self.schedule_preview()
+    
+    def schedule_preview(self):
+        """Request a new preview, rendered once the subtitle has not changed for PREVIEW_DELAY"""
+        self.preview_request_id += 1
+        
+        # The running render is out of date now
+        if self.preview_thread is not None and self.preview_thread.isRunning():
+            self.preview_thread.requestInterruption()
+        
+        self.preview_timer.start()
+    
+    def start_preview(self):
+        """Render the latest preview request in the background"""
+        # Renders do not overlap, the latest request is started when the running one ends
+        if self.preview_thread is not None and self.preview_thread.isRunning():
+            self.preview_pending = True
+            return
+        
+        self.preview_pending = False
+        self.view.show_preview_status("Rendering preview...")
+        
+        self.preview_thread = PreviewThread(
+            self.model,
+            self.preview_request_id,
+            self.view.subtitle_input.text(),
+            self.model.custom_title()
+        )
+        self.preview_thread.preview_ready.connect(self.on_preview_ready)
+        self.preview_thread.finished.connect(self.on_preview_finished)
+        self.preview_thread.start()
+    
+    def on_preview_ready(self, request_id, pil_image):
+        # Ignore previews of requests that were replaced in the meantime
+        if request_id != self.preview_request_id:
+            return
+        
+        self.view.show_preview(pil_to_pixmap(pil_image))
+    
+    def on_preview_finished(self):
+        if self.preview_pending:
+            self.start_preview()
+    
+    def stop_preview(self):
+        """Cancel pending and running previews"""
+        self.preview_timer.stop()
+        self.preview_pending = False
+        self.preview_request_id += 1
+        if self.preview_thread is not None and self.preview_thread.isRunning():
+            self.preview_thread.requestInterruption()
     
     def start_image_generation(self):
+        # The full size render replaces the preview
+        self.stop_preview()
+        
         # Get the subtitle from the input field
         subtitle = self.view.subtitle_input.text()
         
@@ -162,51 +336,107 @@ class LTRCController:
         self.view.image_generated = True
         
         # Convert PIL image to QPixmap for display
-        q_image = ImageQt(pil_image)
-        self.view.original_pixmap = QPixmap.fromImage(q_image)
+        self.view.original_pixmap = pil_to_pixmap(pil_image)
+        self.view.scaled_pixmaps.clear()
         
         # Continue to the write screen after image generation
         self.show_write_screen()
 
+    def selected_export_format(self):
+        """Get the export format chosen on the write screen"""
+        if hasattr(self.view, 'export_format_combo'):
+            return self.view.export_format_combo.currentData() or DEFAULT_EXPORT_FORMAT
+        return DEFAULT_EXPORT_FORMAT
+
+    def start_export(self, export_format, filepath=None, on_done=None, on_failed=None):
+        """
+        Encode the generated image in the background, optionally writing it to a file
+        
+        Args:
+            export_format: Key of the format in exporter.EXPORT_FORMATS
+            filepath: Optional path to write the encoded image to
+            on_done: Optional slot called with the encoded image and the saved file path
+            on_failed: Optional slot called with the error message
+        """
+        thread = ExportThread(self.model, export_format, filepath)
+        if on_done:
+            thread.export_done.connect(on_done)
+        if on_failed:
+            thread.export_failed.connect(on_failed)
+        thread.finished.connect(lambda: self.export_threads.discard(thread))
+        self.export_threads.add(thread)
+        thread.start()
+
+    def on_export_format_changed(self):
+        # Encode the newly chosen format ahead of the copy or save
+        self.start_export(self.selected_export_format())
+
     def copy_image_to_clipboard(self):
         """Copy the generated image to clipboard"""
         if hasattr(self.view, 'original_pixmap') and not self.view.original_pixmap.isNull():
-            # Copy the QPixmap directly to clipboard
-            clipboard = QApplication.clipboard()
-            clipboard.setPixmap(self.view.original_pixmap)
-            
-            # Update the button text to provide feedback
-            self.view.copy_button.setText("Image Copied to Clipboard!")
-            
-            # Reset the button text after 2 seconds
-            QTimer.singleShot(2000, lambda: self.view.copy_button.setText("Copy Image to Clipboard"))
+            self.view.copy_button.setEnabled(False)
+            self.start_export(self.selected_export_format(), on_done=self.on_copy_encoded, on_failed=self.on_copy_failed)
+
+    def on_copy_encoded(self, encoded, _):
+        # The bitmap is what most paste targets read, the encoded bytes are offered next to it
+        # under their own MIME type and take the place of Qt's own encoding of that type
+        mime_data = QMimeData()
+        mime_data.setImageData(self.view.original_pixmap.toImage())
+        mime_data.setData(encoded.mime_type, encoded.data)
+        QApplication.clipboard().setMimeData(mime_data)
+        
+        # Update the button text to provide feedback
+        self.view.copy_button.setEnabled(True)
+        self.view.copy_button.setText("Image Copied to Clipboard!")
+        
+        # Reset the button text after 2 seconds
+        QTimer.singleShot(2000, lambda: self.view.copy_button.setText("Copy Image to Clipboard"))
+
+    def on_copy_failed(self, message):
+        self.view.copy_button.setEnabled(True)
+        self.view.copy_button.setText("Copy failed!")
+        QTimer.singleShot(2000, lambda: self.view.copy_button.setText("Copy Image to Clipboard"))
 
     def save_image(self):
         """Save the generated image to a file"""
         if hasattr(self.view, 'pil_image') and self.view.pil_image:
+            export_format = self.selected_export_format()
+            settings = EXPORT_FORMATS[export_format]
+            extension = settings["extension"]
+            
             # Open a file dialog for the user to choose where to save the image
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            default_name = f"tournament_{self.model.LTRC.mode}_{timestamp}.png"
+            default_name = f"tournament_{self.model.LTRC.mode}_{timestamp}{extension}"
             
             # Use current working directory instead of creating an images directory
             filepath, _ = QFileDialog.getSaveFileName(
                 self.view, 
                 "Save Image", 
                 os.path.join(os.getcwd(), default_name),
-                "PNG Files (*.png);;All Files (*)"
+                f"{settings['label']} (*{extension});;All Files (*)"
             )
             
             if filepath:
-                # Save the image directly without creating any directories
-                self.view.pil_image.save(filepath)
-                
-                # Update save button text to provide feedback
-                self.view.save_button.setText("Image Saved!")
-                
-                # Reset the button text after 2 seconds
-                QTimer.singleShot(2000, lambda: self.view.save_button.setText("Save Image"))
+                # Encode and write the file in the background
+                self.view.save_button.setEnabled(False)
+                self.view.save_button.setText("Saving...")
+                self.start_export(export_format, filepath, on_done=self.on_image_saved, on_failed=self.on_save_failed)
+
+    def on_image_saved(self, encoded, filepath):
+        # Update save button text to provide feedback
+        self.view.save_button.setEnabled(True)
+        self.view.save_button.setText("Image Saved!")
+        
+        # Reset the button text after 2 seconds
+        QTimer.singleShot(2000, lambda: self.view.save_button.setText("Save Image"))
+
+    def on_save_failed(self, message):
+        self.view.save_button.setEnabled(True)
+        self.view.save_button.setText("Save failed!")
+        QTimer.singleShot(2000, lambda: self.view.save_button.setText("Save Image"))
 
     def show_write_screen(self):
+        self.stop_preview()
         self.model.write_table()
         self.view.show_write_screen()
         
@@ -219,6 +449,11 @@ class LTRCController:
                 self.view.copy_button.clicked.connect(self.copy_image_to_clipboard)
             if hasattr(self.view, 'save_button'):
                 self.view.save_button.clicked.connect(self.save_image)
+            if hasattr(self.view, 'export_format_combo'):
+                self.view.export_format_combo.currentIndexChanged.connect(self.on_export_format_changed)
+            
+            # Encode the default format while the user looks at the image
+            self.start_export(self.selected_export_format())
 
     def show_write_loading(self):
         # Show the write loading screen with progress bar
@@ -231,10 +466,21 @@ class LTRCController:
         self.update_thread.start()
 
     def show_end_screen(self):
-        self.model.update_sheet()
+        # The sheet has already been written by the SheetUpdateThread
         self.view.show_end_screen()
         self.view.restart_button.clicked.connect(self.restart)
 
+    def refresh_parameters(self):
+        """Force the K and C values and the tabs to be read from the sheet on the next run"""
+        self.model.refresh_parameters()
+        self.model.refresh_worksheets()
+        
+        # Update the button text to provide feedback
+        self.view.refresh_parameters_button.setText("K/C values and tabs will be reloaded!")
+        
+        # Reset the button text after 2 seconds
+        QTimer.singleShot(2000, lambda: self.view.refresh_parameters_button.setText("Reload K/C values and tabs from sheet"))
+
     def toggle_32track(self, enabled):
         self.model.toggle_32track(enabled)
         
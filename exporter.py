@@ -0,0 +1,113 @@
+import os
+import threading
+from io import BytesIO
+
+'''
+Encoding of generated images for export.
+
+An image is encoded once per format into an in-memory buffer, and that buffer is
+used for every target: the clipboard, files and uploads. The codecs offered are a
+fast PNG, a size-optimized PNG and lossless WebP.
+'''
+
+# Export formats by key: label shown to the user, file extension, MIME type and Pillow save options
+EXPORT_FORMATS = {
+    "fast_png": {
+        "label": "PNG (fast)",
+        "extension": ".png",
+        "mime_type": "image/png",
+        "format": "PNG",
+        "options": {"compress_level": 1},
+    },
+    "optimized_png": {
+        "label": "PNG (smallest)",
+        "extension": ".png",
+        "mime_type": "image/png",
+        "format": "PNG",
+        "options": {"optimize": True},
+    },
+    "webp_lossless": {
+        "label": "WebP (lossless)",
+        "extension": ".webp",
+        "mime_type": "image/webp",
+        "format": "WEBP",
+        "options": {"lossless": True, "quality": 100, "method": 4},
+    },
+}
+
+DEFAULT_EXPORT_FORMAT = "fast_png"
+
+class EncodedImage():
+    def __init__(self, data, export_format):
+        '''
+        Args:
+            data: The encoded image bytes
+            export_format: Key of the format in EXPORT_FORMATS
+        '''
+        self.data = data
+        self.export_format = export_format
+        self.extension = EXPORT_FORMATS[export_format]["extension"]
+        self.mime_type = EXPORT_FORMATS[export_format]["mime_type"]
+
+    def save(self, filepath):
+        '''
+        Write the encoded image to a file, adding the extension of the format if it is missing
+
+        Args:
+            filepath: Path of the file
+
+        Returns:
+            str: Absolute path of the written file
+        '''
+        if not filepath.lower().endswith(self.extension):
+            filepath += self.extension
+
+        with open(filepath, 'wb') as f:
+            f.write(self.data)
+
+        return os.path.abspath(filepath)
+
+    def upload_file(self, name):
+        '''
+        Get the image as a file tuple for a multipart upload, e.g. the files argument of requests.post
+
+        Args:
+            name: File name without extension
+
+        Returns:
+            tuple: (file name, bytes, MIME type)
+        '''
+        return (f"{name}{self.extension}", self.data, self.mime_type)
+
+class ImageExporter():
+    def __init__(self, image):
+        '''
+        Args:
+            image: The PIL image to export
+        '''
+        self.image = image
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+    def encode(self, export_format=DEFAULT_EXPORT_FORMAT):
+        '''
+        Encode the image, only the first request for each format does the work
+
+        Args:
+            export_format: Key of the format in EXPORT_FORMATS
+
+        Returns:
+            EncodedImage: The encoded image
+        '''
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+
+        # The lock keeps two targets from encoding the same format at once
+        with self.lock:
+            if export_format not in self.encoded:
+                settings = EXPORT_FORMATS[export_format]
+                buffer = BytesIO()
+                self.image.save(buffer, format=settings["format"], **settings["options"])
+                self.encoded[export_format] = EncodedImage(buffer.getvalue(), export_format)
+
+            return self.encoded[export_format]
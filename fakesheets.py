@@ -0,0 +1,342 @@
+import random
+import threading
+import time
+
+import gspread
+from gspread.utils import ValueRenderOption, a1_range_to_grid_range
+
+'''
+In-memory stand-in for the LTRC Google Sheets spreadsheet.
+
+LTRC_manager only talks to its spreadsheet through a small part of the gspread API:
+    Spreadsheet: get_worksheet, values_batch_update, values_batch_clear
+    Worksheet:   title, get, update, update_cell, update_cells, batch_get, batch_clear,
+                 get_all_values, col_values, cell, acell, find
+
+FakeSpreadsheet implements exactly that interface on top of an in-memory grid, so
+any object with these methods can be passed as LTRC_manager(sheet=...). Every call
+counts as one round trip and can be slowed down with an injected latency, which
+makes it possible to measure the API cost of the pipeline without a live sheet.
+'''
+
+# Worksheet titles by index, matching the layout of the real spreadsheet
+WORKSHEET_TITLES = {
+    0: "Team Rankings and Personal Evaluation",
+    1: "Rules and Ranks",
+    2: "TR Tables",
+    3: "Table stuff",
+    4: "Playerdata",
+    5: "Teamdata",
+    6: "Placements",
+}
+
+# Team size, first TR_Tables row and rows between teams for every mode
+MODE_LAYOUT = {
+    "FFA": (1, 3, 0),
+    "2vs2": (2, 23, 1),
+    "3vs3": (3, 48, 1),
+    "4vs4": (4, 71, 1),
+    "5vs5": (5, 92, 2),
+    "6vs6": (6, 92, 1),
+}
+
+# Table_stuff columns holding the K values of every mode
+K_COLUMNS = {"FFA": 5, "2vs2": 6, "3vs3": 7, "4vs4": 8, "5vs5": 9}
+
+def _split_range(range_name):
+    '''
+    Split an absolute range like "'TR Tables'!B3:B14" into title and A1 range
+    '''
+    if '!' not in range_name:
+        return None, range_name
+    title, a1 = range_name.rsplit('!', 1)
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, a1
+
+def _grid(range_name):
+    '''
+    Convert an A1 range to 1-based (first_row, last_row, first_col, last_col)
+    '''
+    grid = a1_range_to_grid_range(range_name)
+    return (grid['startRowIndex'] + 1, grid['endRowIndex'],
+            grid['startColumnIndex'] + 1, grid['endColumnIndex'])
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, index, title):
+        self.spreadsheet = spreadsheet
+        self.index = index
+        self.title = title
+        # Raw cell contents by (row, column), formulas are stored as entered
+        self.cells = {}
+
+    def _render(self, raw, value_render_option):
+        '''
+        Render a raw cell the way the Sheets API would return it
+        '''
+        if value_render_option == ValueRenderOption.formula:
+            return raw
+        # Formulas are not evaluated, they render as an empty (image) cell
+        if raw.startswith('='):
+            return ""
+        return raw
+
+    def _read(self, first_row, last_row, first_col, last_col, value_render_option=None):
+        '''
+        Read a block of cells, trimming trailing empty cells and rows like the API does
+        '''
+        rows = []
+        for row in range(first_row, last_row + 1):
+            values = [self._render(self.cells.get((row, col), ""), value_render_option)
+                      for col in range(first_col, last_col + 1)]
+            while values and values[-1] == "":
+                values.pop()
+            rows.append(values)
+        while rows and not rows[-1]:
+            rows.pop()
+        with self.spreadsheet.lock:
+            self.spreadsheet.cells_read += sum(len(row) for row in rows)
+        return rows
+
+    def _write(self, first_row, first_col, values):
+        '''
+        Write a block of values starting at the given cell
+        '''
+        for row_offset, row in enumerate(values):
+            for col_offset, value in enumerate(row):
+                position = (first_row + row_offset, first_col + col_offset)
+                if value is None or value == "":
+                    self.cells.pop(position, None)
+                else:
+                    self.cells[position] = str(value)
+        with self.spreadsheet.lock:
+            self.spreadsheet.cells_written += sum(len(row) for row in values)
+
+    def _clear(self, range_name):
+        first_row, last_row, first_col, last_col = _grid(range_name)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                self.cells.pop((row, col), None)
+        with self.spreadsheet.lock:
+            self.spreadsheet.cells_written += (last_row - first_row + 1) * (last_col - first_col + 1)
+
+    def _size(self):
+        if not self.cells:
+            return 0, 0
+        return max(row for row, _ in self.cells), max(col for _, col in self.cells)
+
+    # === gspread Worksheet interface ===
+
+    def get(self, range_name, value_render_option=None):
+        self.spreadsheet._round_trip("get")
+        rows = self._read(*_grid(range_name), value_render_option)
+        return rows if rows else [[]]
+
+    def batch_get(self, ranges, value_render_option=None):
+        self.spreadsheet._round_trip("batch_get")
+        return [self._read(*_grid(range_name), value_render_option) for range_name in ranges]
+
+    def get_all_values(self, value_render_option=None):
+        self.spreadsheet._round_trip("get_all_values")
+        num_rows, num_cols = self._size()
+        rows = self._read(1, num_rows, 1, num_cols, value_render_option)
+        # get_all_values pads every row to the same width
+        return [row + [""] * (num_cols - len(row)) for row in rows]
+
+    def col_values(self, col, value_render_option=None):
+        self.spreadsheet._round_trip("col_values")
+        num_rows, _ = self._size()
+        values = [row[0] if row else "" for row in self._read(1, num_rows, col, col, value_render_option)]
+        return values
+
+    def cell(self, row, col, value_render_option=None):
+        self.spreadsheet._round_trip("cell")
+        rows = self._read(row, row, col, col, value_render_option)
+        value = rows[0][0] if rows and rows[0] else None
+        return gspread.cell.Cell(row, col, value)
+
+    def acell(self, label, value_render_option=None):
+        first_row, _, first_col, _ = _grid(label)
+        return self.cell(first_row, first_col, value_render_option)
+
+    def find(self, query, case_sensitive=True):
+        self.spreadsheet._round_trip("find")
+        for (row, col) in sorted(self.cells):
+            value = self._render(self.cells[(row, col)], None)
+            if value == query or (not case_sensitive and value.casefold() == str(query).casefold()):
+                return gspread.cell.Cell(row, col, value)
+        return None
+
+    def update(self, range_name, values=None, **kwargs):
+        # Accept both update(range, values) and the gspread 6 order update(values, range)
+        if not isinstance(range_name, str):
+            range_name, values = values, range_name
+        self.spreadsheet._round_trip("update")
+        first_row, _, first_col, _ = _grid(range_name)
+        self._write(first_row, first_col, values)
+
+    def update_cell(self, row, col, value):
+        self.spreadsheet._round_trip("update_cell")
+        self._write(row, col, [[value]])
+
+    def update_cells(self, cell_list, value_input_option=None):
+        self.spreadsheet._round_trip("update_cells")
+        for cell in cell_list:
+            self._write(cell.row, cell.col, [[cell.value]])
+
+    def batch_clear(self, ranges):
+        self.spreadsheet._round_trip("batch_clear")
+        for range_name in ranges:
+            self._clear(range_name)
+
+class FakeSpreadsheet:
+    def __init__(self, latency=0.0):
+        '''
+        Args:
+            latency: Seconds every API call is delayed by, to simulate a slow link
+        '''
+        self.latency = latency
+        self.worksheets = {index: FakeWorksheet(self, index, title) for index, title in WORKSHEET_TITLES.items()}
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        '''
+        Reset the round trip and cell counters
+        '''
+        self.calls = 0
+        self.calls_by_method = {}
+        self.cells_read = 0
+        self.cells_written = 0
+
+    def _round_trip(self, method):
+        '''
+        Count an API call and wait for the injected latency
+        '''
+        with self.lock:
+            self.calls += 1
+            self.calls_by_method[method] = self.calls_by_method.get(method, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _worksheet_by_title(self, title):
+        for worksheet in self.worksheets.values():
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    # === gspread Spreadsheet interface ===
+
+    def get_worksheet(self, index):
+        return self.worksheets[index]
+
+    def values_batch_update(self, body):
+        self._round_trip("values_batch_update")
+        for update in body['data']:
+            title, range_name = _split_range(update['range'])
+            first_row, _, first_col, _ = _grid(range_name)
+            self._worksheet_by_title(title)._write(first_row, first_col, update['values'])
+
+    def values_batch_clear(self, body):
+        self._round_trip("values_batch_clear")
+        for absolute_range in body['ranges']:
+            title, range_name = _split_range(absolute_range)
+            self._worksheet_by_title(title)._clear(range_name)
+
+def create_ltrc_spreadsheet(mode="FFA", num_players=None, roster_size=200, latency=0.0, seed=0):
+    '''
+    Create a fake spreadsheet with the LTRC layout and a room typed into TR_Tables
+
+    The room contains placed players, unplaced players at every placement stage
+    and one player that is not in the database yet.
+
+    Args:
+        mode: The mode of the room, e.g. "FFA" or "2vs2"
+        num_players: Number of racers in the room, defaults to a full room
+        roster_size: Number of additional players in Playerdata
+        latency: Seconds every API call is delayed by
+        seed: Seed for the generated names, scores and ratings
+
+    Returns:
+        FakeSpreadsheet: The populated spreadsheet
+    '''
+    rng = random.Random(seed)
+    team_size, first_row, team_gap = MODE_LAYOUT[mode]
+    if num_players is None:
+        num_players = 10 if mode == "5vs5" else 12
+
+    spreadsheet = FakeSpreadsheet()
+    TR_Tables = spreadsheet.get_worksheet(2)
+    Table_stuff = spreadsheet.get_worksheet(3)
+    Playerdata = spreadsheet.get_worksheet(4)
+    Placements = spreadsheet.get_worksheet(6)
+
+    # Table_stuff: mode, C constant and the K values of every mode
+    C = 1200
+    Table_stuff.cells[(1, 3)] = mode
+    Table_stuff.cells[(1, 5)] = str(C)
+    for k_mode, col in K_COLUMNS.items():
+        ranks = 12 // MODE_LAYOUT[k_mode][0]
+        for rank in range(ranks):
+            # Winners gain about a quarter of C, the last place loses as much
+            gain = C / 4 - (C / 2) * rank / max(1, ranks - 1)
+            Table_stuff.cells[(11 + rank, col)] = str(int(C / 12 + C / 2 - gain))
+
+    # Playerdata and Placements headers
+    Playerdata.cells[(1, 1)] = "Name"
+    Playerdata.cells[(1, 4)] = "MMR"
+    Playerdata.cells[(1, 5)] = "Mii"
+    Playerdata.cells[(1, 11)] = "Previous season"
+    Playerdata.cells[(30, 22)] = '=IMAGE("https://example.invalid/mii/default.png")'
+    for row in range(1, 5):
+        Placements.cells[(row, 1)] = f"Placements header {row}"
+
+    # The racers of the room: placed, unplaced at every stage and one new player
+    stages = ["", "1/3", "2/3"]
+    racers = []
+    for i in range(num_players):
+        name = f"Racer {i + 1:02d}"
+        if i == num_players - 1:
+            racers.append((name, None, None))
+        elif i % 4 == 3:
+            racers.append((name, "???", stages[(i // 4) % 3]))
+        else:
+            racers.append((name, str(rng.randint(1000, 12000)), None))
+
+    playerdata_row = 2
+    placements_row = 5
+    roster = racers[:-1] + [(f"Player {i + 1:03d}", str(rng.randint(1000, 12000)), None) for i in range(roster_size)]
+    for name, mmr, stage in roster:
+        Playerdata.cells[(playerdata_row, 1)] = name
+        Playerdata.cells[(playerdata_row, 4)] = mmr
+        Playerdata.cells[(playerdata_row, 5)] = f'=IMAGE("https://example.invalid/mii/{playerdata_row}.png")'
+        Playerdata.cells[(playerdata_row, 11)] = str(rng.randint(1000, 12000))
+        playerdata_row += 1
+
+        if stage is not None:
+            Placements.cells[(placements_row, 1)] = name
+            if stage:
+                Placements.cells[(placements_row, 2)] = stage
+            for done in range(stages.index(stage)):
+                Placements.cells[(placements_row, 4 + done)] = str(rng.randint(20, 120))
+            Placements.cells[(placements_row, 8)] = str(rng.randint(-200, 200))
+            placements_row += 1
+
+    # Scores, sorted so that the best team is typed in first
+    teams = [racers[i:i + team_size] for i in range(0, len(racers), team_size)]
+    scored = [[(racer, rng.randint(20, 120)) for racer in team] for team in teams]
+    scored.sort(key=lambda team: sum(score for _, score in team), reverse=True)
+
+    row = first_row
+    for team in scored:
+        for (name, mmr, _), score in team:
+            TR_Tables.cells[(row, 2)] = name
+            TR_Tables.cells[(row, 3)] = str(score)
+            TR_Tables.cells[(row, 5)] = mmr if mmr is not None else "???"
+            row += 1
+        row += team_gap
+
+    # Only count the traffic of the code under test
+    spreadsheet.latency = latency
+    spreadsheet.reset_stats()
+    return spreadsheet
@@ -1,8 +1,13 @@
 import os
-from PIL import Image, ImageDraw, ImageFont, ImageColor
+from PIL import Image, ImageDraw, ImageFont, ImageColor, ImageFilter
 import requests
 from io import BytesIO
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import hashlib
+import json
+import time
 
 # MMR Ranges
 # Tin: 0-1999
@@ -18,15 +23,494 @@ import threading
 # Monarch: 11000-14999
 # Sovereign: 15000+
 
+# Pixels of blur radius per step of downscaling the shadow mask before blurring it
+SHADOW_BLUR_PER_STEP = 4
+
+class ImageDiskCache:
+    """
+    Persistent, content-addressed cache for images fetched over HTTP.
+
+    Downloaded files are stored under the SHA-256 of their content and an index maps
+    every URL to its file together with the ETag and Last-Modified headers. Cached
+    files are used without any request while they are fresh, revalidated with a
+    conditional request afterwards, and used as a fallback when the network fails.
+    The least recently used files are evicted when the cache grows beyond its size limit.
+    """
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, max_age=24 * 60 * 60):
+        """
+        Args:
+            directory: Folder to keep the cached files and index in
+            max_bytes: Maximum total size of the cached files
+            max_age: Seconds a cached file is used without revalidating it
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Ignoring unreadable image cache index {self.index_path}: {e}")
+
+    @classmethod
+    def shared(cls, directory, **kwargs):
+        """
+        Get the cache for a directory, shared by all generators in this process
+        
+        Args:
+            directory: Folder to keep the cached files and index in
+            **kwargs: Settings passed to the constructor when the cache is created
+        """
+        directory = os.path.abspath(directory)
+        with cls._shared_lock:
+            if directory not in cls._shared:
+                cls._shared[directory] = cls(directory, **kwargs)
+            return cls._shared[directory]
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, f"{digest}.bin")
+
+    def _read_blob(self, entry):
+        try:
+            with open(self._blob_path(entry['hash']), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save_index(self):
+        """Write the index to disk, must be called with the lock held"""
+        temp_path = self.index_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not write image cache index {self.index_path}: {e}")
+
+    def _store(self, url, content, headers):
+        """
+        Store downloaded content for a URL and evict old files if needed
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+
+        # Identical content is only stored once
+        if not os.path.exists(blob_path):
+            temp_path = blob_path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, blob_path)
+
+        with self.lock:
+            self.entries[url] = {
+                'hash': digest,
+                'size': len(content),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'validated': time.time(),
+                'used': time.time(),
+            }
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        """Remove the least recently used files until the cache fits, must be called with the lock held"""
+        sizes = {}
+        for entry in self.entries.values():
+            sizes[entry['hash']] = entry['size']
+        total = sum(sizes.values())
+
+        for url, entry in sorted(self.entries.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            del self.entries[url]
+
+            # Only delete the file when no other URL shares its content
+            if not any(other['hash'] == entry['hash'] for other in self.entries.values()):
+                total -= entry['size']
+                try:
+                    os.remove(self._blob_path(entry['hash']))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _is_image(content):
+        """Check that downloaded content is a complete image before it is cached"""
+        try:
+            with Image.open(BytesIO(content)) as img:
+                img.verify()
+            return True
+        except Exception:
+            return False
+
+    def _touch(self, url, validated=False):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry['used'] = time.time()
+                if validated:
+                    entry['validated'] = entry['used']
+                self._save_index()
+
+    def fetch(self, url, session, timeout):
+        """
+        Get the content of a URL, from the cache when possible
+
+        Args:
+            url: URL to fetch
+            session: requests.Session used for network requests
+            timeout: Request timeout in seconds
+
+        Returns:
+            bytes: The content, or None if it could not be fetched and is not cached
+        """
+        with self.lock:
+            entry = dict(self.entries[url]) if url in self.entries else None
+
+        cached = self._read_blob(entry) if entry else None
+
+        # Fresh entries are used without any request
+        if cached is not None and time.time() - entry['validated'] < self.max_age:
+            self._touch(url)
+            return cached
+
+        # Revalidate cached entries with a conditional request
+        headers = {}
+        if cached is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            # Offline, fall back to the cached copy if there is one
+            if cached is not None:
+                print(f"Using cached image for {url}: {e}")
+            return cached
+
+        if response.status_code == 304 and cached is not None:
+            self._touch(url, validated=True)
+            return cached
+
+        if response.status_code == 200:
+            # Error pages and truncated downloads are not cached, the last good copy stays in use
+            if not self._is_image(response.content):
+                print(f"Ignoring invalid image from {url}")
+                return cached
+
+            try:
+                self._store(url, response.content, response.headers)
+            except OSError as e:
+                print(f"Could not cache image from {url}: {e}")
+            return response.content
+
+        # Unexpected status, keep using the cached copy if there is one
+        return cached
+
+class FontRegistry:
+    """
+    Process-wide cache of loaded fonts keyed by (font file, size).
+
+    ImageFont.truetype parses the font file on every call, so fonts are loaded once
+    and shared by every generator. Hit and miss counters show how well it works.
+    Text widths are memoized per (font, text) as well.
+
+    A FreeType font must not be used by two threads at once, so a preview and a full
+    render measure and draw text under the lock of the font, see font_lock.
+    """
+    _fonts = {}
+    _widths = {}
+    _font_locks = {}
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def get(cls, font_file, size):
+        """
+        Get a font, loading it on first use
+        
+        Args:
+            font_file: Path to the TrueType font file
+            size: Font size
+            
+        Returns:
+            PIL.ImageFont.FreeTypeFont: The font
+        """
+        key = (font_file, size)
+        with cls._lock:
+            font = cls._fonts.get(key)
+            if font is not None:
+                cls.hits += 1
+                return font
+            
+            cls.misses += 1
+            font = ImageFont.truetype(font_file, size)
+            cls._fonts[key] = font
+            return font
+
+    @classmethod
+    def preload(cls, font_file, sizes):
+        """
+        Load every font size used by the configured formats
+        
+        Args:
+            font_file: Path to the TrueType font file
+            sizes: The font sizes, e.g. AppConfig.font_sizes
+        """
+        with cls._lock:
+            for size in sizes:
+                if (font_file, size) not in cls._fonts:
+                    cls._fonts[(font_file, size)] = ImageFont.truetype(font_file, size)
+
+    @classmethod
+    def font_lock(cls, font):
+        """
+        Get the lock that guards a shared font
+        
+        Args:
+            font: A font from the registry
+            
+        Returns:
+            threading.Lock: The lock of the font
+        """
+        key = (font.path, font.size)
+        with cls._lock:
+            lock = cls._font_locks.get(key)
+            if lock is None:
+                lock = cls._font_locks[key] = threading.Lock()
+            return lock
+
+    @classmethod
+    def text_width(cls, font, text):
+        """
+        Get the width of a text in a font, measuring every (font, text) pair once
+        
+        Args:
+            font: A font from the registry
+            text: The text to measure
+            
+        Returns:
+            float: The width in pixels
+        """
+        key = (font.path, font.size, text)
+        width = cls._widths.get(key)
+        if width is None:
+            # Names change between renders, so the cache is emptied instead of growing forever
+            if len(cls._widths) >= 10000:
+                cls._widths.clear()
+            with cls.font_lock(font):
+                width = font.getlength(text)
+            cls._widths[key] = width
+        return width
+
+    @classmethod
+    def stats(cls):
+        """Get the number of cached fonts and the hit and miss counts"""
+        with cls._lock:
+            return {'fonts': len(cls._fonts), 'hits': cls.hits, 'misses': cls.misses}
+
+class IconAtlas:
+    """
+    Process-wide store of icons that are already resized and tinted, ready to paste.
+
+    Every (icon file, size, tint) combination is resampled and tinted once, so drawing
+    a player row only pastes finished icons.
+    """
+    _icons = {}
+    _sources = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _source(cls, path):
+        """Load an icon file once, must be called with the lock held"""
+        if path not in cls._sources:
+            try:
+                img = Image.open(path)
+                img.load()
+                cls._sources[path] = img.convert('RGBA') if img.mode != 'RGBA' else img
+            except (FileNotFoundError, IOError) as e:
+                print(f"Error loading icon from {path}: {e}")
+                cls._sources[path] = None
+        return cls._sources[path]
+
+    @classmethod
+    def get(cls, path, size, tint=None):
+        """
+        Get an icon at a size, optionally tinted with a single color
+        
+        Args:
+            path: Path to the icon file
+            size: Tuple (width, height) of the icon
+            tint: Optional color string the icon is filled with, keeping its shape
+            
+        Returns:
+            PIL.Image: The icon, or None if the file could not be loaded. It is shared and must not be modified.
+        """
+        key = (path, size, tint)
+        icon = cls._icons.get(key)
+        if icon is not None or key in cls._icons:
+            return icon
+        
+        with cls._lock:
+            if key in cls._icons:
+                return cls._icons[key]
+            
+            icon = cls._source(path)
+            if icon is not None:
+                if icon.size != size:
+                    icon = icon.resize(size, Image.LANCZOS)
+                
+                if tint:
+                    # Fill the icon with the tint color, using the icon as a mask
+                    rgb_color = ImageColor.getrgb(tint)
+                    tinted_icon = Image.new('RGBA', size, (0, 0, 0, 0))
+                    tinted_icon.paste(Image.new('RGBA', size, (*rgb_color, 255)), (0, 0), icon.split()[3])
+                    icon = tinted_icon
+            
+            cls._icons[key] = icon
+            return icon
+
+class BackgroundCache:
+    """
+    Process-wide cache of decoded and resized background images.
+
+    The background is decoded and resampled once per (path, size, modification time)
+    and kept as an opaque RGBA template. Every render starts from a copy of the template.
+    """
+    _templates = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path, size, fallback_color):
+        """
+        Get a fresh copy of the background
+        
+        Args:
+            path: Path to the background image
+            size: Tuple (width, height) of the image
+            fallback_color: Color string shown behind transparent parts of the image,
+                            or on its own when the background image can't be loaded
+            
+        Returns:
+            PIL.Image: An opaque RGBA background the caller may draw on
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except (OSError, TypeError):
+            mtime = None
+        
+        key = (path, size, mtime, fallback_color)
+        with cls._lock:
+            template = cls._templates.get(key)
+            if template is None:
+                template = cls._load(path, size, fallback_color, mtime)
+                
+                # Forget older versions of the same background
+                for old_key in [k for k in cls._templates if k[:2] == (path, size)]:
+                    del cls._templates[old_key]
+                cls._templates[key] = template
+        
+        return template.copy()
+
+    @staticmethod
+    def _load(path, size, fallback_color, mtime):
+        """Decode and resize the background, or create a plain one"""
+        img = Image.new('RGBA', size, ImageColor.getrgb(fallback_color))
+        if mtime is not None:
+            try:
+                # Try to load the background image
+                background = Image.open(path)
+                # Resize to match configured dimensions if needed
+                if background.size != size:
+                    background = background.resize(size)
+                # Show the background color through transparent parts so the template is opaque
+                img.alpha_composite(background.convert('RGBA') if background.mode != 'RGBA' else background)
+            except (FileNotFoundError, IOError):
+                # Fall back to background color if image can't be loaded
+                pass
+        
+        return img
+
+class LayerCache:
+    """
+    Process-wide cache of the header-independent part of recent results images.
+
+    The podium and regular players, drawn with their shadow onto the background, only
+    depend on the results, so a new title or subtitle for the same results only needs
+    the header to be drawn again. Only the most recent results are kept.
+    """
+    max_entries = 4
+    _layers = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def key(format_type, results, config, scale=1.0):
+        """
+        Build the cache key for a set of results
+        
+        Args:
+            format_type: The format of the tournament
+            results: List of player/team results
+            config: The appconfig.AppConfig of the generator
+            scale: Output scale of the generator
+            
+        Returns:
+            str: Hash of everything the body of the image depends on
+        """
+        try:
+            background_mtime = os.path.getmtime(config.background_image)
+        except OSError:
+            background_mtime = None
+        
+        # The digest of the configuration stands in for the configuration itself
+        data = json.dumps([format_type, results, config.digest, scale, background_mtime], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get(cls, key):
+        """Get the cached body image for a key, or None"""
+        with cls._lock:
+            layer = cls._layers.get(key)
+            if layer is not None:
+                cls._layers.move_to_end(key)
+            return layer
+
+    @classmethod
+    def store(cls, key, layer):
+        """Cache the body image for a key, dropping the oldest entries beyond max_entries"""
+        with cls._lock:
+            cls._layers[key] = layer
+            cls._layers.move_to_end(key)
+            while len(cls._layers) > cls.max_entries:
+                cls._layers.popitem(last=False)
+
+class RenderCancelled(Exception):
+    """Raised by LTRCImageGenerator.generate when the render is no longer wanted"""
+
 class LTRCImageGenerator:
-    def __init__(self, format_type, config, progress_callback=None):
+    def __init__(self, format_type, config, progress_callback=None, scale=1.0, cancelled=None):
         """
         Initialize the tournament image generator with a specific format type.
         
         Args:
             format_type: The format of the tournament (e.g., "FFA", "2vs2")
-            config: Configuration dictionary for the image generator
+            config: The compiled configuration, see appconfig.ConfigService
             progress_callback: Optional callback function for progress updates
+            scale: Size of the output relative to the configured size, e.g. 0.5 for previews
+            cancelled: Optional function returning True once the render is no longer wanted,
+                       checked between the render steps
         """
         # Store the provided config
         self.config = config
@@ -35,26 +519,34 @@ class LTRCImageGenerator:
         self.format_type = format_type
         
         # Store all commonly used configuration sections as class attributes
-        self.width = self.config['width']
-        self.height = self.config['height']
-        self.font_file = self.config['font_file']
-        self.colors = self.config['colors']
+        self.width = self.config.width
+        self.height = self.config.height
+        
+        # The layout always uses the configured size, only drawing happens at the output size
+        self.scale = scale
+        self.output_size = (round(self.width * scale), round(self.height * scale))
+        self.font_file = self.config.font_file
+        self.colors = self.config.colors
         
         # Format specific configurations
-        self.format_config = self.config['formats'][self.format_type]
-        self.header_config = self.format_config['header']
-        self.podium_style = self.format_config['podium_style']
-        self.podium_count = self.format_config['podium_count']
-        self.team_size = self.format_config['team_size']
+        self.profile = self.config.formats[self.format_type]
+        self.header_config = self.profile.header
+        self.podium_style = self.profile.podium_style
+        self.podium_count = self.profile.podium_count
+        self.team_size = self.profile.team_size
+        
+        # Load the fonts of every format once per process
+        FontRegistry.preload(self.font_file, self.config.font_sizes)
         
         # Path to rank icons folder
-        self.rank_icons_dir = os.path.join(os.path.dirname(__file__), 'rank_icons')
+        self.rank_icons_dir = self.config.rank_icons_dir
 
         # Image cache for faster repeated loading - only caches original images
         self.image_cache = {}
         
         # Progress tracking
         self.progress_callback = progress_callback
+        self.cancelled = cancelled
         self.total_steps = 0
         self.completed_steps = 0
         self.progress_lock = threading.Lock()
@@ -73,6 +565,25 @@ class LTRCImageGenerator:
         
         # Request timeout
         self.request_timeout = 5  # seconds
+        
+        # Mii images fetched before rendering, by URL
+        self.mii_images = {}
+        # Whether any Mii was replaced by the default Mii or left out because it did not load
+        self.miis_incomplete = False
+        
+        # Persistent cache for downloaded Mii images, if configured
+        self.disk_cache = None
+        if self.config.mii_cache_dir:
+            self.disk_cache = ImageDiskCache.shared(
+                self.config.mii_cache_dir,
+                max_bytes=self.config.mii_cache_max_mb * 1024 * 1024,
+                max_age=self.config.mii_cache_max_age_hours * 60 * 60
+            )
+
+    def _check_cancelled(self):
+        """Stop the render with RenderCancelled if it is no longer wanted"""
+        if self.cancelled is not None and self.cancelled():
+            raise RenderCancelled()
 
     def _update_progress(self, increment=1, message=None):
         """
@@ -117,11 +628,17 @@ class LTRCImageGenerator:
         try:
             if source.startswith(('http://', 'https://')):
                 # Load from URL (only used for Mii images)
-                response = self.session.get(source, stream=True, timeout=self.request_timeout)
-                if response.status_code == 200:
-                    img = Image.open(BytesIO(response.content))
+                if self.disk_cache:
+                    content = self.disk_cache.fetch(source, self.session, self.request_timeout)
+                    if content is None:
+                        return None
+                    img = Image.open(BytesIO(content))
                 else:
-                    return None
+                    response = self.session.get(source, stream=True, timeout=self.request_timeout)
+                    if response.status_code == 200:
+                        img = Image.open(BytesIO(response.content))
+                    else:
+                        return None
             else:
                 # Load from local file
                 img = Image.open(source)
@@ -152,85 +669,76 @@ class LTRCImageGenerator:
 
     def _create_base_image(self):
         """Create the base image with background"""
-        # Check if background image is specified
-        try:
-            # Try to load the background image
-            img = Image.open(self.config['background_image'])
-            # Resize to match configured dimensions if needed
-            if img.size != (self.width, self.height):
-                img = img.resize((self.width, self.height))
-        except (FileNotFoundError, IOError):
-            # Fall back to background color if image can't be loaded
-            img = Image.new('RGBA', (self.width, self.height), 
-                            ImageColor.getrgb(self.config['background_color']))
-        
-        return img
+        return BackgroundCache.get(self.config.background_image, self.output_size,
+                                   self.config.background_color)
 
-    def _render_header(self, img, title=None, subtitle=None):
+    def _layout_header(self, title=None, subtitle=None):
         """
-        Render the header section with title and subtitle
+        Lay out the header section with title and subtitle
         
         Args:
-            img: The PIL image to draw on
             title: Optional custom title text (overrides default format title)
             subtitle: Optional custom subtitle text
+            
+        Returns:
+            list: Draw operations for the header
         """
-        draw = ImageDraw.Draw(img)
+        ops = []
         
         # === Render title ===
-        title_font = ImageFont.truetype(self.font_file, self.header_config['title_size'])
+        title_font = FontRegistry.get(self.font_file, self.header_config.title_size)
         
         # Use custom title if provided, otherwise use default format title
         title_text = title if title else f"{self.format_type} Results"
         
-        title_width = draw.textlength(title_text, font=title_font)
+        title_width = FontRegistry.text_width(title_font, title_text)
         title_x = (self.width - title_width) // 2
-        title_y = self.header_config['title_y']
+        title_y = self.header_config.title_y
         
-        # Draw main title text (without shadow for now)
-        draw.text((title_x, title_y), title_text, 
-                 fill=self.header_config['title_color'], font=title_font)
+        # Draw main title text
+        ops.append(("text", (title_x, title_y), title_text, title_font, self.header_config.title_color))
         
         # === Render subtitle ===
-        subtitle_font = ImageFont.truetype(self.font_file, self.header_config['subtitle_size'])
-        subtitle_width = draw.textlength(subtitle, font=subtitle_font)
+        subtitle_font = FontRegistry.get(self.font_file, self.header_config.subtitle_size)
+        subtitle_width = FontRegistry.text_width(subtitle_font, subtitle)
         subtitle_x = (self.width - subtitle_width) // 2
-        subtitle_y = self.header_config['subtitle_y']
+        subtitle_y = self.header_config.subtitle_y
         
-        # Draw main subtitle text (without shadow for now)
-        draw.text((subtitle_x, subtitle_y), subtitle, 
-                    fill=self.header_config['subtitle_color'], font=subtitle_font)
+        # Draw main subtitle text
+        ops.append(("text", (subtitle_x, subtitle_y), subtitle, subtitle_font, self.header_config.subtitle_color))
         
-        return img
+        return ops
 
-    def _draw_mii(self, img, mii_url, x_pos, y_pos, mii_size):
+    def _layout_mii(self, ops, mii_url, x_pos, y_pos, mii_size):
         """
-        Draw a player's Mii image at the specified position
+        Lay out a player's Mii image at the specified position
         
         Args:
-            img: The PIL image to draw on
+            ops: List of draw operations to add to
             mii_url: URL or path to the Mii image
             x_pos: X position to draw the Mii
             y_pos: Y Position to draw the Mii
             mii_size: Size (width and height) of the Mii image
         """
         # Load Mii image with caching
-        mii_img = self._load_image(mii_url, (mii_size, mii_size))
+        if mii_url in self.mii_images:
+            # Use the prefetched image, which is None if neither it nor the default Mii could be loaded
+            mii_img = self.mii_images[mii_url]
+            if mii_img is not None:
+                mii_img = mii_img.resize((mii_size, mii_size)) if mii_img.size != (mii_size, mii_size) else mii_img.copy()
+        else:
+            mii_img = self._load_image(mii_url, (mii_size, mii_size))
         
         # Paste if loaded successfully
         if mii_img:
-            # Paste with or without transparency mask
-            if mii_img.mode == 'RGBA':
-                img.paste(mii_img, (x_pos, y_pos), mii_img)
-            else:
-                img.paste(mii_img, (x_pos, y_pos))
+            ops.append(("image", (x_pos, y_pos), mii_img))
 
-    def _draw_miis_vertical(self, img, results, team_index, y_pos, center_x):
+    def _layout_miis_vertical(self, ops, results, team_index, y_pos, center_x):
         """
-        Draw Miis vertically alongside player names (for 5v5 and 6v6 formats)
+        Lay out Miis vertically alongside player names (for 5v5 and 6v6 formats)
         
         Args:
-            img: The PIL image to draw on
+            ops: List of draw operations to add to
             results: List of player results
             team_index: Index of the team in the results list
             y_pos: Starting vertical position
@@ -240,12 +748,12 @@ class LTRCImageGenerator:
             None
         """
         # Get Mii configuration
-        mii_config = self.podium_style['mii']
-        mii_size = mii_config['size']
+        mii_config = self.profile.mii
+        mii_size = mii_config.size
         team_size = self.team_size
-        mii_y_offset = mii_config['y_offset']
-        x_offset = mii_config['x_offset']
-        mii_vertical_spacing = mii_config['horizontal_spacing']  
+        mii_y_offset = mii_config.y_offset
+        x_offset = mii_config.x_offset
+        mii_vertical_spacing = mii_config.horizontal_spacing  
         
         # Calculate starting positions
         mii_x = center_x - x_offset  # Use the configured x_offset value
@@ -262,7 +770,7 @@ class LTRCImageGenerator:
                 member_y = mii_y_pos + (member_idx * (mii_size + mii_vertical_spacing))
                 
                 # Draw the Mii - pass the URL directly
-                self._draw_mii(img, mii_url, mii_x, member_y, mii_size)
+                self._layout_mii(ops, mii_url, mii_x, member_y, mii_size)
 
     def _determine_rank_from_mmr(self, mmr):
         """
@@ -299,12 +807,12 @@ class LTRCImageGenerator:
         else:
             return "sovereign"
 
-    def _draw_player_score_line(self, img, player_data, center_x, stats_y, stats_size, horizontal_spacing):
+    def _layout_player_score_line(self, ops, player_data, center_x, stats_y, stats_size, horizontal_spacing):
         """
-        Draw the complete player score line with all stats and icons
+        Lay out the complete player score line with all stats and icons
         
         Args:
-            img: The PIL image to draw on
+            ops: List of draw operations to add to
             player_data: Player data dictionary with score, mmr_change, etc.
             center_x: X center position for centering the text
             stats_y: Y position for stats
@@ -314,8 +822,6 @@ class LTRCImageGenerator:
         Returns:
             None
         """
-        draw = ImageDraw.Draw(img)
-        
         # Extract player stats
         player_score = player_data["score"]
         mmr_change = player_data["mmr_change"]
@@ -336,8 +842,8 @@ class LTRCImageGenerator:
             rank_change = 1 if new_mmr > old_mmr else -1
         
         # Create stats text
-        stats_font = ImageFont.truetype(self.font_file, stats_size)
-        name_color = self.colors['positions']['default']  # Default text color
+        stats_font = FontRegistry.get(self.font_file, stats_size)
+        name_color = self.colors.positions['default']  # Default text color
         
         # Format the text components
         separator = " | "
@@ -349,7 +855,7 @@ class LTRCImageGenerator:
         new_mmr_text = f"{new_mmr}*" if completion in ["1/3", "2/3"] else f"{new_mmr}"
         
         # Calculate MMR color
-        mmr_color = self.colors['mmr_up'] if mmr_change >= 0 else self.colors['mmr_down']
+        mmr_color = self.colors.mmr_up if mmr_change >= 0 else self.colors.mmr_down
         
         # Check if we need to show placement completion instead of rank icons
         if completion in ["1/3", "2/3"]:
@@ -358,90 +864,55 @@ class LTRCImageGenerator:
             placement_color = name_color  # Use same color as name
         else:
             # Player is fully placed - prepare rank change and rank icons
-            # Get direction icon path based on rank change
-            direction_icon = None
-            direction_tint = None
-            
+            # Get the direction icon based on rank change, tinted for rank ups and downs
             if completion == "3/3":
                 direction_path = self._get_direction_icon_path("right")
                 direction_tint = None
             elif rank_change > 0:
                 direction_path = self._get_direction_icon_path("up")
-                direction_tint = self.colors['mmr_up']
+                direction_tint = self.colors.mmr_up
             elif rank_change < 0:
                 direction_path = self._get_direction_icon_path("down")
-                direction_tint = self.colors['mmr_down']
+                direction_tint = self.colors.mmr_down
             else:
                 direction_path = self._get_direction_icon_path("neutral")
                 direction_tint = None
             
-            # Load direction icon with caching
+            # Get the icons from the atlas, already sized and tinted
             rank_change_icon_size = (stats_size - 5, stats_size - 5)
-            direction_icon = self._load_image(direction_path, rank_change_icon_size)
+            direction_icon = IconAtlas.get(direction_path, rank_change_icon_size, direction_tint)
             
-            # Get rank icon path and load it
-            rank_icon = None
             rank_icon_size = (stats_size, stats_size)
-            rank_icon_path = self._get_rank_icon_path(rank)
-            rank_icon = self._load_image(rank_icon_path, rank_icon_size)
-        
-        # Calculate icon sizes
-        rank_change_icon_size = (stats_size - 5, stats_size - 5)
-        rank_icon_size = (stats_size, stats_size)
-        
-        # Build stats text to calculate width for centering
-        full_stats_text = f"{score_text}{separator}{mmr_text}{separator}{new_mmr_text}"
-        full_stats_width = draw.textlength(full_stats_text, font=stats_font)
-        
-        # Add width of completion text or icon widths
-        separator_width = draw.textlength(separator, font=stats_font)
+            rank_icon = IconAtlas.get(self._get_rank_icon_path(rank), rank_icon_size)
         
+        # Text segments of the line in drawing order, each measured once
+        segments = [(score_text, name_color), (separator, name_color), (mmr_text, mmr_color),
+                    (separator, name_color), (new_mmr_text, name_color), (separator, name_color)]
         if completion in ["1/3", "2/3"]:
-            # Calculate width needed for completion text
-            placement_width = draw.textlength(placement_text, font=stats_font)
-            icons_width = placement_width
-        else:
-            # Calculate width needed for icons
-            icons_width = 0
-            if 'direction_icon' in locals() and direction_icon:
+            # Completion text is shown instead of icons
+            segments.append((placement_text, placement_color))
+        widths = [FontRegistry.text_width(stats_font, text) for text, _ in segments]
+        
+        # Calculate width needed for icons
+        icons_width = 0
+        if completion not in ["1/3", "2/3"]:
+            if direction_icon:
                 icons_width += rank_change_icon_size[0] + horizontal_spacing//2
-            if 'rank_icon' in locals() and rank_icon:
+            if rank_icon:
                 icons_width += rank_icon_size[0]
         
         # Center everything
-        total_width = full_stats_width + separator_width + icons_width
+        total_width = sum(widths) + icons_width
         stats_x = center_x - total_width//2
         
-        # Draw score
-        draw.text((stats_x, stats_y), score_text, fill=name_color, font=stats_font)
-        stats_x += draw.textlength(score_text, font=stats_font)
-        
-        # Draw first separator
-        draw.text((stats_x, stats_y), separator, fill=name_color, font=stats_font)
-        stats_x += draw.textlength(separator, font=stats_font)
-        
-        # Draw MMR change
-        draw.text((stats_x, stats_y), mmr_text, fill=mmr_color, font=stats_font)
-        stats_x += draw.textlength(mmr_text, font=stats_font)
-        
-        # Draw second separator
-        draw.text((stats_x, stats_y), separator, fill=name_color, font=stats_font)
-        stats_x += draw.textlength(separator, font=stats_font)
-        
-        # Draw new MMR (with asterisk for placement players)
-        draw.text((stats_x, stats_y), new_mmr_text, fill=name_color, font=stats_font)
-        stats_x += draw.textlength(new_mmr_text, font=stats_font)
-        
-        # Draw separator before icons or completion text
-        draw.text((stats_x, stats_y), separator, fill=name_color, font=stats_font)
-        stats_x += draw.textlength(separator, font=stats_font)
+        # Place the text segments one after the other
+        for (text, color), width in zip(segments, widths):
+            ops.append(("text", (stats_x, stats_y), text, stats_font, color))
+            stats_x += width
         
-        if completion in ["1/3", "2/3"]:
-            # Draw completion text instead of icons
-            draw.text((stats_x, stats_y), placement_text, fill=placement_color, font=stats_font)
-        else:
+        if completion not in ["1/3", "2/3"]:
             # Get icon vertical alignment adjustment from config and scale it with the stats size
-            base_icon_y_offset = self.podium_style['icon_y_offset']
+            base_icon_y_offset = self.podium_style.icon_y_offset
             # Scale offset based on the ratio of current size to a reference size (e.g., 40)
             reference_size = 40  # Reference font size for scaling
             icon_y_offset = base_icon_y_offset * (stats_size / reference_size)
@@ -449,58 +920,44 @@ class LTRCImageGenerator:
             # Calculate common vertical position for both icons with configurable and scaled offset
             icons_y = stats_y + (stats_size - rank_change_icon_size[1]) // 2 + int(icon_y_offset)
             
-            # Draw direction icon
+            # Place direction icon
             if direction_icon:
-                # Apply tinting if needed
-                if direction_tint:
-                    # Convert hex color to RGB tuple
-                    rgb_color = ImageColor.getrgb(direction_tint)
-                    
-                    # Create a solid color image with our tint
-                    tint = Image.new('RGBA', direction_icon.size, (*rgb_color, 255))
-                    
-                    # Apply tint by using the icon as a mask
-                    mask = direction_icon.split()[3]
-                    tinted_icon = Image.new('RGBA', direction_icon.size, (0, 0, 0, 0))
-                    tinted_icon.paste(tint, (0, 0), mask)
-                    direction_icon = tinted_icon
-                
-                # Paste direction icon
-                img.paste(direction_icon, (int(stats_x), int(icons_y)), direction_icon)
+                ops.append(("image", (int(stats_x), int(icons_y)), direction_icon))
                 stats_x += rank_change_icon_size[0] + horizontal_spacing//2
             
-            # Draw rank icon
+            # Place rank icon
             if rank_icon:
-                # Paste rank icon
-                img.paste(rank_icon, (int(stats_x), int(icons_y)), rank_icon)
+                ops.append(("image", (int(stats_x), int(icons_y)), rank_icon))
 
-    def _render_podium(self, img, results):
+    def _layout_podium(self, results):
         """
-        Render the podium section with medals and player information
+        Lay out the podium section with medals and player information
         
         Args:
-            img: The PIL image to draw on
             results: List of player results
+            
+        Returns:
+            list: Draw operations for the podium
         """
-        draw = ImageDraw.Draw(img)
+        ops = []
         
         # Get spacing configurations
-        vertical_spacing = self.podium_style['vertical_spacing']
-        horizontal_spacing = self.podium_style['horizontal_spacing']
+        vertical_spacing = self.podium_style.vertical_spacing
+        horizontal_spacing = self.podium_style.horizontal_spacing
         
         # Get configuration parameters for medals
-        medal_width = self.podium_style['medal_width']
-        medal_height = self.podium_style['medal_height']
-        position_size = self.podium_style['position_size']
-        position_x = self.podium_style['position_x']
-        position_offset_x = self.podium_style['position_offset_x']
-        position_offset_y = self.podium_style['position_offset_y']
+        medal_width = self.podium_style.medal_width
+        medal_height = self.podium_style.medal_height
+        position_size = self.podium_style.position_size
+        position_x = self.podium_style.position_x
+        position_offset_x = self.podium_style.position_offset_x
+        position_offset_y = self.podium_style.position_offset_y
         
         # Get the general podium start_x (for elements other than medals and Mii)
-        podium_start_x = self.podium_style['start_x']
+        podium_start_x = self.podium_style.start_x
 
         # Initialize y position tracker - start at the configured start_y position
-        y_pos = self.podium_style['start_y']
+        y_pos = self.podium_style.start_y
         
         # Draw medals for top positions
         for i in range(min(self.podium_count, len(results) // self.team_size)):
@@ -509,76 +966,63 @@ class LTRCImageGenerator:
             
             # Get position number and color
             position = str(i + 1)
-            medal_color = self.colors['positions'][position]
+            medal_color = self.colors.positions[position]
             
             # Get size based on position
-            position_size = self.podium_style['position_sizes'][i]
-            name_size = self.podium_style['name_sizes'][i]
-            stats_size = self.podium_style['stats_sizes'][i]
+            position_size = self.podium_style.position_sizes[i]
+            name_size = self.podium_style.name_sizes[i]
+            stats_size = self.podium_style.stats_sizes[i]
             
             # Draw medal rectangle
-            draw.rectangle(
-                [(x_pos, y_pos), (x_pos + medal_width, y_pos + medal_height)],
-                fill=medal_color
-            )
+            ops.append(("rectangle", [(x_pos, y_pos), (x_pos + medal_width, y_pos + medal_height)], medal_color))
             x_pos += medal_width + horizontal_spacing
             
             # Draw position text with position-specific size
-            position_font = ImageFont.truetype(self.font_file, position_size)
+            position_font = FontRegistry.get(self.font_file, position_size)
             position_text = f"#{position}"
             position_y = y_pos + position_offset_y
             
             # Update x_pos with position_x config value
             x_pos = position_x + position_offset_x
             
-            draw.text(
-                (x_pos, position_y),
-                position_text,
-                fill=medal_color,
-                font=position_font
-            )
+            ops.append(("text", (x_pos, position_y), position_text, position_font, medal_color))
             
             # Update x_pos after drawing position text
-            position_width = draw.textlength(position_text, font=position_font)
+            position_width = FontRegistry.text_width(position_font, position_text)
             x_pos += position_width + horizontal_spacing
             
             # Add WINNER text for the first position
             if i == 0:
                 # Get winner font size and center_x from config
-                winner_font_size = self.podium_style['winner']['font_size']
-                winner_font = ImageFont.truetype(self.font_file, winner_font_size)
+                winner_font_size = self.podium_style.winner.font_size
+                winner_font = FontRegistry.get(self.font_file, winner_font_size)
                 winner_text = "WINNER"
                 
                 # Use podium_start_x for winner text positioning instead of center_x
                 center_x = podium_start_x  # Use the new start_x parameter
                 
                 # Calculate the x position to center the text
-                winner_width = draw.textlength(winner_text, font=winner_font)
+                winner_width = FontRegistry.text_width(winner_font, winner_text)
                 winner_x = center_x - winner_width // 2
                 
                 # Draw the centered WINNER text
-                draw.text(
-                    (winner_x, position_y),
-                    winner_text,
-                    fill=self.colors['gold'],
-                    font=winner_font
-                )
+                ops.append(("text", (winner_x, position_y), winner_text, winner_font, self.colors.gold))
                 
                 # After drawing the first position's row, increment y_pos
                 y_pos += medal_height + vertical_spacing
                 
                 # Get Mii configuration from the updated config structure
-                mii_config = self.podium_style['mii']
-                mii_size = mii_config['size']
-                mii_horizontal_spacing = mii_config['horizontal_spacing']
-                mii_y_offset = mii_config['y_offset']
-                team_size = self.format_config['team_size']
+                mii_config = self.profile.mii
+                mii_size = mii_config.size
+                mii_horizontal_spacing = mii_config.horizontal_spacing
+                mii_y_offset = mii_config.y_offset
+                team_size = self.team_size
                 
                 # For larger team sizes (5v5, 6v6), draw Miis vertically
                 if team_size > 4:
                     # Draw Miis vertically alongside player names using the new method
-                    self._draw_miis_vertical(
-                        img, 
+                    self._layout_miis_vertical(
+                        ops, 
                         results, 
                         i,  # team_index 
                         y_pos, 
@@ -605,14 +1049,14 @@ class LTRCImageGenerator:
                             x_pos = mii_start_x + (team_member_idx * (mii_size + mii_horizontal_spacing))
                             
                             # Draw the Mii using the helper method - pass URL directly
-                            self._draw_mii(img, mii_url, x_pos, mii_y_pos, mii_size)
+                            self._layout_mii(ops, mii_url, x_pos, mii_y_pos, mii_size)
                     
                     # Update y_pos after drawing Miis
-                    mii_bottom_spacing = mii_config['bottom_spacing']
+                    mii_bottom_spacing = mii_config.bottom_spacing
                     y_pos += mii_size + mii_bottom_spacing
 
             # Draw player info for each team member
-            name_color = self.podium_style['name_color']
+            name_color = self.podium_style.name_color
             center_x = podium_start_x  # Use the new start_x parameter
             team_y_pos = y_pos  # Start position for the team
             
@@ -624,8 +1068,8 @@ class LTRCImageGenerator:
                     player_data = results[player_idx]
                     
                     # Draw this team member's info
-                    member_y_pos = self._draw_player_info(
-                        img,
+                    member_y_pos = self._layout_player_info(
+                        ops,
                         player_data,
                         team_y_pos,
                         position_offset_y,
@@ -645,29 +1089,33 @@ class LTRCImageGenerator:
             # Add extra spacing between podium entries
             y_pos += vertical_spacing
         
-        return img
+        return ops
 
-    def _render_regular_players(self, img, results):
+    def _layout_regular_players(self, results):
         """
-        Render the regular (non-podium) players section
+        Lay out the regular (non-podium) players section
         
         Args:
-            img: The PIL image to draw on
             results: List of player results
+            
+        Returns:
+            list: Draw operations for the regular players
         """
+        ops = []
+        
         # Get regular style configuration
-        regular_style = self.format_config['regular_style']
+        regular_style = self.profile.regular_style
         
         # Get configuration parameters
-        name_size = regular_style['name_size']
-        stats_size = regular_style['stats_size']
-        horizontal_spacing = regular_style['horizontal_spacing']
-        row_spacing = regular_style['row_spacing']
-        name_color = regular_style['name_color']
-        start_x = regular_style['start_x']
-        start_y = regular_style['start_y']
-        column_spacing = regular_style['column_spacing']
-        column_y_offset = regular_style['column_y_offset']
+        name_size = regular_style.name_size
+        stats_size = regular_style.stats_size
+        horizontal_spacing = regular_style.horizontal_spacing
+        row_spacing = regular_style.row_spacing
+        name_color = regular_style.name_color
+        start_x = regular_style.start_x
+        start_y = regular_style.start_y
+        column_spacing = regular_style.column_spacing
+        column_y_offset = regular_style.column_y_offset
         
         # Initialize position tracking
         current_x = start_x
@@ -696,8 +1144,8 @@ class LTRCImageGenerator:
                     player_data = results[player_idx]
                     
                     # Draw this team member's info
-                    member_y_pos = self._draw_player_info(
-                        img,
+                    member_y_pos = self._layout_player_info(
+                        ops,
                         player_data,
                         team_y_pos,
                         0,
@@ -724,14 +1172,14 @@ class LTRCImageGenerator:
                 current_x = start_x
                 current_y += team_height + row_spacing
         
-        return img
+        return ops
 
-    def _draw_player_info(self, img, player_data, y_pos, position_offset_y, name_size, stats_size, center_x, name_color, horizontal_spacing):
+    def _layout_player_info(self, ops, player_data, y_pos, position_offset_y, name_size, stats_size, center_x, name_color, horizontal_spacing):
         """
-        Draw player name and score line together
+        Lay out player name and score line together
         
         Args:
-            img: The PIL image to draw on
+            ops: List of draw operations to add to
             player_data: Dictionary containing player information
             y_pos: Current vertical position
             position_offset_y: Vertical offset for elements
@@ -744,36 +1192,30 @@ class LTRCImageGenerator:
         Returns:
             Updated y_pos after drawing all elements
         """
-        draw = ImageDraw.Draw(img)
         player_name = player_data["name"]
         
-        # Create font for player name
-        name_font = ImageFont.truetype(self.font_file, name_size)
+        # Get font for player name
+        name_font = FontRegistry.get(self.font_file, name_size)
         
         # Calculate x position to center the player name
-        name_width = draw.textlength(player_name, font=name_font)
+        name_width = FontRegistry.text_width(name_font, player_name)
         name_x = center_x - name_width // 2
         
         # Calculate vertical position for name based on y_pos
         name_y = y_pos + position_offset_y
         
         # Draw player name centered at center_x
-        draw.text(
-            (name_x, name_y),
-            player_name,
-            fill=name_color,
-            font=name_font
-        )
+        ops.append(("text", (name_x, name_y), player_name, name_font, name_color))
         
         # Update y_pos after drawing name
-        y_pos += name_size + self.podium_style['vertical_spacing']
+        y_pos += name_size + self.podium_style.vertical_spacing
         
         # Calculate stats position based on current y_pos
         stats_y = y_pos + position_offset_y
         
         # Draw player stats line with all components
-        self._draw_player_score_line(
-            img, 
+        self._layout_player_score_line(
+            ops, 
             player_data,
             center_x, 
             stats_y,
@@ -782,69 +1224,218 @@ class LTRCImageGenerator:
         )
         
         # Update y_pos after drawing stats
-        y_pos += stats_size + self.podium_style['vertical_spacing']
+        y_pos += stats_size + self.podium_style.vertical_spacing
         
         return y_pos
 
-    def _apply_shadow_to_image(self, img, shadow_color=(0, 0, 0), shadow_offset=(2, 2)):
+    def layout(self, results, subtitle=None, title=None):
         """
-        Apply a shadow effect to the entire image by creating a copy and offsetting it
+        Lay out the whole results image without drawing anything. Every text is
+        measured once and the result is a list of positioned draw operations:
+            ("text", (x, y), text, font, color)
+            ("rectangle", box, color)
+            ("image", (x, y), image)
+        in drawing order, which _rasterize turns into pixels.
         
         Args:
-            img: The PIL image to apply shadow to
-            shadow_color: Color tuple for the shadow
-            shadow_offset: (x, y) offset for the shadow
+            results: List of player/team results to display
+            subtitle: Optional subtitle text for the image
+            title: Optional custom title
             
         Returns:
-            New image with shadow effect
+            list: The draw operations
         """
-        # Create a copy of the original image for the shadow
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-        
-        # Create a shadow image (black version of original)
-        shadow = Image.new('RGBA', img.size, (0, 0, 0, 0))
-        shadow.paste(shadow_color, (0, 0), img.split()[3])  # Use alpha channel as mask
-        
-        # Create a new image that can fit both the original and the shadow
-        combined_width = img.width + abs(shadow_offset[0])
-        combined_height = img.height + abs(shadow_offset[1])
-        combined = Image.new('RGBA', (combined_width, combined_height), (0, 0, 0, 0))
-        
-        # Calculate paste positions
-        shadow_pos = (max(0, shadow_offset[0]), max(0, shadow_offset[1]))
-        img_pos = (max(0, -shadow_offset[0]), max(0, -shadow_offset[1]))
+        return self._layout_header(title, subtitle) + self._layout_body(results)
+
+    def _layout_body(self, results):
+        """Lay out everything below the header: the podium and the regular players"""
+        ops = self._layout_podium(results)
+        if len(results) > self.podium_count:
+            ops += self._layout_regular_players(results)
+        return ops
+
+    def _rasterize(self, img, ops):
+        """
+        Draw a list of draw operations from layout onto an image
         
-        # Paste shadow first, then the original image
-        combined.paste(shadow, shadow_pos, shadow.split()[3])
-        combined.paste(img, img_pos, img.split()[3])
+        Args:
+            img: The PIL image to draw on
+            ops: The draw operations
+            
+        Returns:
+            The image
+        """
+        draw = ImageDraw.Draw(img)
+        scale = self.scale
+        for op in ops:
+            if scale != 1.0:
+                op = self._scale_op(op, scale)
+            
+            if op[0] == "text":
+                with FontRegistry.font_lock(op[3]):
+                    draw.text(op[1], op[2], fill=op[4], font=op[3])
+            elif op[0] == "rectangle":
+                draw.rectangle(op[1], fill=op[2])
+            elif op[0] == "image":
+                # Paste with or without transparency mask
+                image = op[2]
+                img.paste(image, op[1], image if image.mode == 'RGBA' else None)
+        return img
+
+    def _scale_op(self, op, scale):
+        """Convert a draw operation from layout coordinates to the output size"""
+        if op[0] == "text":
+            x, y = op[1]
+            font = FontRegistry.get(op[3].path, max(1, round(op[3].size * scale)))
+            return ("text", (x * scale, y * scale), op[2], font, op[4])
+        elif op[0] == "rectangle":
+            return ("rectangle", [(x * scale, y * scale) for x, y in op[1]], op[2])
+        elif op[0] == "image":
+            x, y = op[1]
+            image = op[2]
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            return ("image", (round(x * scale), round(y * scale)), image.resize(size, Image.BILINEAR))
+        return op
+
+    def _composite_with_shadow(self, base, content, shadow_offset=(2, 2)):
+        """
+        Draw the content onto the base image with a drop shadow underneath it.
+        The shadow is filled straight into the base using the alpha channel of the
+        content as a mask, cropped to the area that has content, so no full size
+        layers are allocated.
         
-        return combined
+        Args:
+            base: The opaque RGBA image to draw on, modified in place
+            content: RGBA image of the same size holding the content
+            shadow_offset: (x, y) offset for the shadow
+            
+        Returns:
+            The base image
+        """
+        shadow_color = self.config.shadow.color
+        if len(shadow_color) == 3:
+            shadow_color += (255,)
+        blur_radius = self.config.shadow.blur_radius * self.scale
+        
+        alpha = content.getchannel('A')
+        bbox = alpha.getbbox()
+        if bbox is None:
+            return base
+        
+        # Only the area with content casts a shadow, with room for the blur to spread
+        padding = int(blur_radius * 3)
+        left = max(0, bbox[0] - padding)
+        top = max(0, bbox[1] - padding)
+        right = min(content.width, bbox[2] + padding)
+        bottom = min(content.height, bbox[3] + padding)
+        
+        shadow_mask = alpha.crop((left, top, right, bottom))
+        del alpha
+        
+        # A soft shadow has no detail to lose, so large blurs and the opacity
+        # are applied to a reduced mask that is scaled back up afterwards
+        full_size = shadow_mask.size
+        factor = min(max(1, round(blur_radius / SHADOW_BLUR_PER_STEP)), *full_size)
+        if factor > 1:
+            shadow_mask = shadow_mask.reduce(factor)
+        if blur_radius > 0:
+            shadow_mask = shadow_mask.filter(ImageFilter.GaussianBlur(blur_radius / factor))
+        if shadow_color[3] != 255:
+            shadow_mask = shadow_mask.point(lambda value: value * shadow_color[3] // 255)
+        if factor > 1:
+            shadow_mask = shadow_mask.resize(full_size, Image.BILINEAR)
+        
+        # Fill the shadow color through the mask at the shadow offset
+        x_pos = left + shadow_offset[0]
+        y_pos = top + shadow_offset[1]
+        base.paste(shadow_color[:3], (x_pos, y_pos, x_pos + shadow_mask.width, y_pos + shadow_mask.height), shadow_mask)
+        
+        # Blend the content over its shadow. Pasting with a mask also blends the alpha
+        # channel, so it is restored afterwards since the base is opaque.
+        base.paste(content, (0, 0), content)
+        base.putalpha(255)
+        
+        return base
 
     def preload_common_assets(self):
-        """Preload commonly used assets in parallel"""
-        paths_to_load = []
+        """Build the rank and direction icons at every stats size used by this format"""
+        stats_sizes = self.profile.icon_sizes
         
-        # Add direction icons
-        for direction in ["up", "down", "neutral", "right"]:
-            paths_to_load.append(self._get_direction_icon_path(direction))
+        # Direction icons with the tint they are drawn with
+        direction_icons = [("up", self.colors.mmr_up), ("down", self.colors.mmr_down),
+                           ("neutral", None), ("right", None)]
+        ranks = ["tin", "bronze", "silver", "gold", "emerald", "sapphire",
+                 "ruby", "duke", "master", "grandmaster", "monarch", "sovereign"]
         
-        # Add rank icons for all ranks
-        for rank in ["tin", "bronze", "silver", "gold", "emerald", "sapphire", 
-                    "ruby", "duke", "master", "grandmaster", "monarch", "sovereign"]:
-            paths_to_load.append(self._get_rank_icon_path(rank))
+        # Update progress tracking
+        self.total_steps += len(stats_sizes)
+        
+        for stats_size in sorted(stats_sizes):
+            for direction, tint in direction_icons:
+                IconAtlas.get(self._get_direction_icon_path(direction), (stats_size - 5, stats_size - 5), tint)
+            for rank in ranks:
+                IconAtlas.get(self._get_rank_icon_path(rank), (stats_size, stats_size))
+            self._update_progress(1, f"Preloaded icons at size {stats_size}")
+
+    def prefetch_miis(self, results):
+        """
+        Download and decode the Mii images of all results in parallel.
+        Every distinct URL is fetched once and progress is reported per completed fetch.
+        Miis that fail or are still loading after the request timeout are replaced by
+        the default Mii, so a slow server never holds up the render. Such a render sets
+        miis_incomplete, so its body is not stored in the layer cache.
         
-        if not paths_to_load:
+        Args:
+            results: List of player/team results to display
+        """
+        mii_urls = []
+        default_urls = {}
+        for player in results:
+            url = player.get("mii")
+            if url is not None and url not in default_urls:
+                mii_urls.append(url)
+                default_urls[url] = player.get("default_mii")
+        
+        # The default Mii is fetched along with the others since it may be needed as a fallback
+        fetch_urls = list(mii_urls)
+        for url in default_urls.values():
+            if url and url not in fetch_urls:
+                fetch_urls.append(url)
+        
+        if not fetch_urls:
             return
         
-        # Update progress tracking
-        self.total_steps += len(paths_to_load)
+        loaded = {}
+        finished = threading.Event()
         
-        # Load assets one by one
-        for path in paths_to_load:
-            self._load_image(path)
-            self._update_progress(1, f"Preloaded: {os.path.basename(path)}")
-            
+        def fetch(url):
+            img = self._load_image(url)
+            # Late downloads only fill the cache, the progress of this render is already complete
+            if not finished.is_set():
+                loaded[url] = img
+                self._update_progress(1, f"Loaded Mii: {os.path.basename(url)[:30]}")
+            return img
+        
+        # The pool matches the connection pool of the session
+        executor = ThreadPoolExecutor(max_workers=min(10, len(fetch_urls)))
+        try:
+            futures = [executor.submit(fetch, url) for url in fetch_urls]
+            _, not_done = wait(futures, timeout=self.request_timeout)
+            finished.set()
+        finally:
+            # Fetches that did not finish in time are left to complete in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        if not_done:
+            print(f"{len(not_done)} Mii image(s) did not load in time, using the default Mii")
+            self._update_progress(len(not_done), "Using the default Mii for slow downloads")
+        
+        for url in mii_urls:
+            img = loaded.get(url)
+            if img is None:
+                self.miis_incomplete = True
+                img = loaded.get(default_urls[url])
+            self.mii_images[url] = img
 
     def generate(self, results, subtitle=None, title=None):
         """
@@ -865,60 +1456,77 @@ class LTRCImageGenerator:
         # 3. Final processing and composition
         self.total_steps = 3
         
-        # Add steps for Mii loading (one per player with a Mii)
-        mii_count = sum(1 for player in results if player.get("mii") is not None)
-        self.total_steps += mii_count
+        shadow_offset = tuple(round(offset * self.scale) for offset in self.header_config.shadow_offset)
+        
+        # The body only depends on the results, so title and subtitle edits reuse it
+        body_key = LayerCache.key(self.format_type, results, self.config, self.scale)
+        body_img = LayerCache.get(body_key)
+        
+        if body_img is None:
+            body_img = self._render_body(results, shadow_offset)
+            # A body drawn with fallback Miis is not reused, the next render tries the real Miis again
+            if not self.miis_incomplete:
+                LayerCache.store(body_key, body_img)
+        else:
+            self._update_progress(2, "Reused the rendered podium and players")
+        
+        self._check_cancelled()
+        
+        # Draw the header and its shadow onto a copy of the body (final step)
+        header_img = Image.new('RGBA', self.output_size, (0, 0, 0, 0))
+        self._rasterize(header_img, self._layout_header(title, subtitle))
+        
+        final_img = body_img.copy()
+        self._composite_with_shadow(final_img, header_img, shadow_offset)
+        self._update_progress(1, "Final image composition completed")
+        
+        return final_img
+
+    def _render_body(self, results, shadow_offset):
+        """
+        Render the podium and regular players with their shadow onto the background
+        
+        Args:
+            results: List of player/team results to display
+            shadow_offset: (x, y) offset for the shadow
+            
+        Returns:
+            PIL.Image: The background with the body drawn on it
+        """
+        # Add steps for Mii loading (one per distinct Mii image)
+        mii_urls = set()
+        for player in results:
+            if player.get("mii") is not None:
+                mii_urls.add(player["mii"])
+                if player.get("default_mii"):
+                    mii_urls.add(player["default_mii"])
+        self.total_steps += len(mii_urls)
         
         # Preload common assets (rank icons, direction icons)
         self.preload_common_assets()
         self._update_progress(1, "Preloaded common assets")
         
         # Prefetch all Mii images
-        mii_urls = []
-        for player in results:
-            if player.get("mii") is not None:
-                mii_urls.append(player["mii"]) 
-                
-        if mii_urls:
-            for url in mii_urls:
-                self._load_image(url)
-                self._update_progress(1, f"Loaded Mii: {os.path.basename(url)[:30]}")
+        self.prefetch_miis(results)
+        self._check_cancelled()
     
         # Update progress for starting the rendering process
         self._update_progress(0, "Rendering tournament results image...")
         
         # Create a transparent canvas for drawing content
-        content_img = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
+        content_img = Image.new('RGBA', self.output_size, (0, 0, 0, 0))
         
-        # Combine all rendering steps
-        content_img = self._render_header(content_img, title, subtitle)
-        content_img = self._render_podium(content_img, results)
-        if len(results) > self.podium_count:
-            content_img = self._render_regular_players(content_img, results)
-        
-        # Get shadow parameters
-        shadow_offset = tuple(self.header_config['shadow_offset'])
-        shadow_color = (0, 0, 0)  # Pure black
-        
-        # Apply shadow effect to the entire content
-        shadowed_img = self._apply_shadow_to_image(content_img, shadow_color, shadow_offset)
+        # Lay out everything, then draw it in one pass
+        ops = self._layout_body(results)
+        self._check_cancelled()
+        self._rasterize(content_img, ops)
+        self._check_cancelled()
         
         # Complete the rendering step
         self._update_progress(1, "Image rendered successfully")
         
-        # Create background and final composition (final step)
-        background = self._create_base_image()
-        
-        # Create final image by combining shadowed content with background
-        final_img = Image.new('RGBA', background.size, (0, 0, 0, 0))
-        final_img.paste(background, (0, 0))
-        
-        # Calculate position to center the shadowed image on background
-        x_pos = (background.width - shadowed_img.width) // 2
-        y_pos = (background.height - shadowed_img.height) // 2
-        
-        # Paste the shadowed content onto the background
-        final_img.paste(shadowed_img, (x_pos, y_pos), shadowed_img)
-        self._update_progress(1, "Final image composition completed")
+        # Start from a copy of the cached background and draw the content and its shadow onto it
+        body_img = self._create_base_image()
+        self._composite_with_shadow(body_img, content_img, shadow_offset)
         
-        return final_img
\ No newline at end of file
+        return body_img
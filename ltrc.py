@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+from exporter import DEFAULT_EXPORT_FORMAT, EXPORT_FORMATS
+
+'''
+Headless command line entry point for the LTRC pipeline.
+
+    python ltrc.py compute [--mode 2vs2] [--32track] [--200cc]
+    python ltrc.py render --subtitle "Week 12" [--format webp_lossless] [--output results.webp]
+    python ltrc.py write
+    python ltrc.py run-all --subtitle "Week 12"
+
+Progress goes to stderr and the results to stdout, or both to stdout as JSON
+lines with --json while other messages go to stderr. Nothing here imports PyQt6, and the pipeline modules are only
+imported once a command runs, so the command line starts quickly.
+'''
+
+COMMANDS = ("compute", "render", "write", "run-all")
+
+class Reporter():
+    def __init__(self, json_output=False):
+        '''
+        Args:
+            json_output: Print JSON lines instead of terminal text
+        '''
+        self.json_output = json_output
+        self.stage = None
+        self.stream = sys.stdout
+
+    def _emit(self, event, **fields):
+        print(json.dumps({"event": event, **fields}), file=self.stream, flush=True)
+
+    def progress(self, value, message=None):
+        '''
+        Report the progress of the current stage, usable as a progress_callback
+        '''
+        if self.json_output:
+            self._emit("progress", stage=self.stage, percent=value, message=message)
+        else:
+            print(f"[{self.stage:<7} {value:>3}%] {message or ''}", file=sys.stderr, flush=True)
+
+    def result(self, command, data, elapsed):
+        '''
+        Report the result of a command
+
+        Args:
+            command: Name of the command
+            data: Dictionary with the result
+            elapsed: Seconds the command took
+        '''
+        if self.json_output:
+            self._emit("result", command=command, elapsed=round(elapsed, 3), **data)
+            return
+
+        if "racers" in data:
+            print(f"{'racer':<24} {'score':>5} {'MMR':>7} {'change':>7} {'new MMR':>8}")
+            for racer in data["racers"]:
+                print(f"{racer['name']:<24} {racer['score']:>5} {racer['mmr']:>7} {racer['change']:>7} {racer['new_mmr']:>8}")
+        if "image" in data:
+            print(f"Image saved to {data['image']} ({data['image_bytes'] // 1024} KB)")
+        if "cells" in data:
+            print(f"Wrote {data['cells']} cells in {data['calls']} API call(s)")
+        print(f"{command} finished in {elapsed:.2f}s")
+
+    def error(self, message):
+        if self.json_output:
+            self._emit("error", stage=self.stage, message=message)
+        else:
+            print(f"An error occurred: {message}", file=sys.stderr)
+
+def create_model(args):
+    '''
+    Connect to the sheet and apply the mode and options from the command line
+
+    Returns:
+        LTRCModel: The model
+    '''
+    from model import LTRCModel
+
+    sheet = None
+    if args.fake:
+        from fakesheets import create_ltrc_spreadsheet
+        sheet = create_ltrc_spreadsheet(args.mode or "FFA")
+
+    model = LTRCModel(sheet)
+    model.connection.result()
+    if args.mode:
+        model.set_mode(args.mode)
+    model.toggle_32track(args.flag_32track)
+    model.toggle_200cc(args.flag_200cc)
+    model.toggle_ott(args.flag_ott)
+    return model
+
+def compute(model, reporter):
+    '''
+    Read the room from TR_Tables and calculate the new ratings
+
+    Returns:
+        dict: The racers with their scores and ratings
+    '''
+    reporter.stage = "compute"
+    racers, scores, MMRs, deltas, new_MMRs = model.get_table_data(reporter.progress)
+    return {
+        "mode": model.LTRC.mode,
+        "racers": [
+            {"name": name, "score": score, "mmr": mmr, "change": delta, "new_mmr": new_mmr}
+            for name, score, mmr, delta, new_mmr in zip(racers, scores, MMRs, deltas, new_MMRs)
+        ],
+    }
+
+def render(model, reporter, args):
+    '''
+    Generate the results image and save it in the chosen export format
+
+    Returns:
+        dict: Path and size of the saved image
+    '''
+    reporter.stage = "render"
+    model.generate_image(args.subtitle, reporter.progress, model.custom_title())
+
+    if args.output:
+        encoded = model.export_image(args.format)
+        filepath = encoded.save(args.output)
+    else:
+        filepath = model.save_image_to_file(export_format=args.format)
+        encoded = model.export_image(args.format)
+
+    return {"image": filepath, "image_bytes": len(encoded.data), "format": args.format}
+
+def write(model, reporter):
+    '''
+    Fill the result tables and write the new ratings and placements to the sheet
+
+    Returns:
+        dict: Number of cells sent and API calls made
+    '''
+    reporter.stage = "write"
+    model.write_table()
+    write_plan = model.update_sheet(reporter.progress)
+    return {"cells": write_plan.cells_sent, "calls": write_plan.calls_made}
+
+def run(args, reporter):
+    '''
+    Run a command
+
+    Returns:
+        dict: The result of the command
+    '''
+    reporter.stage = "connect"
+    reporter.progress(0, "Connecting to the sheet...")
+    model = create_model(args)
+
+    # Every command needs the ratings of the room
+    data = compute(model, reporter)
+
+    if args.command in ("render", "run-all"):
+        data.update(render(model, reporter, args))
+
+    if args.command in ("write", "run-all"):
+        data.update(write(model, reporter))
+
+    return data
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ltrc", description="Run the LTRC pipeline without the user interface")
+    parser.add_argument("command", choices=COMMANDS,
+                        help="compute: calculate the ratings, render: also save the results image, "
+                             "write: also write the ratings to the sheet, run-all: compute, render and write")
+    parser.add_argument("--mode", choices=("FFA", "2vs2", "3vs3", "4vs4", "5vs5", "6vs6"),
+                        help="Mode of the room, defaults to the mode set in the sheet")
+    parser.add_argument("--32track", dest="flag_32track", action="store_true", help="The room played 32 tracks")
+    parser.add_argument("--200cc", dest="flag_200cc", action="store_true", help="The room played 200cc")
+    parser.add_argument("--ott", dest="flag_ott", action="store_true", help="Mark the results image as OTT")
+    parser.add_argument("--subtitle", default="", help="Subtitle of the results image")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=DEFAULT_EXPORT_FORMAT, help="Export format of the results image")
+    parser.add_argument("--output", help="Path of the results image, defaults to a timestamped file in images/")
+    parser.add_argument("--json", action="store_true", help="Print progress and results as JSON lines on stdout")
+    parser.add_argument("--fake", action="store_true", help="Run against an in-memory fake spreadsheet instead of Google Sheets")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    reporter = Reporter(args.json)
+
+    start = time.perf_counter()
+    try:
+        # Messages printed by the pipeline would break the JSON lines, they go to stderr instead
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            data = run(args, reporter)
+    except Exception as e:
+        reporter.error(str(e))
+        return 1
+
+    reporter.result(args.command, data, time.perf_counter() - start)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,132 @@
 from MMR import LTRC_manager
-from imagegen import LTRCImageGenerator
+from exporter import DEFAULT_EXPORT_FORMAT, ImageExporter
+from appconfig import ConfigService
 import os
 from datetime import datetime
-from PIL import Image
-from io import BytesIO
-import json
-import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-class LTRCModel:
+# Size of the live preview relative to the full image
+PREVIEW_SCALE = 0.5
+
+# Write phases of the "Write" step, in the order they are queued
+WRITE_PHASES = ["placements_mmr", "playerdata", "clear_table"]
+
+class CommitJournal:
+    """
+    Records which write phases have finished for the current tournament run,
+    so that repeated or re-entrant writes never apply the same changes twice.
+    """
     def __init__(self):
-        self.LTRC = LTRC_manager()
+        self.run_id = None
+        self.completed_phases = set()
+
+    def start_run(self):
+        """
+        Start a new tournament run with no finished phases
+        
+        Returns:
+            str: The ID of the new run
+        """
+        self.run_id = uuid.uuid4().hex
+        self.completed_phases = set()
+        return self.run_id
+
+    def is_done(self, phase):
+        """Check whether a write phase already finished in the current run"""
+        return phase in self.completed_phases
+
+    def mark_done(self, phases):
+        """Record that the given write phases finished in the current run"""
+        self.completed_phases.update(phases)
+
+class LTRCModel:
+    def __init__(self, sheet=None):
+        """
+        Args:
+            sheet: Optional spreadsheet backend, e.g. a fakesheets.FakeSpreadsheet
+        """
+        # Connecting to the sheet happens in the background while the user picks a mode
+        self.sheet = sheet
+        self.connection = None
+        self.connect()
+        
         self.generated_image = None
+        self.exporter = None
+        self.results = None
+        self.results_lock = threading.Lock()
         self.flag_32track = False
         self.flag_200cc = False
         self.flag_ott = False
+        
+        # A reload of the K and C values asked for before or while connecting is applied to the next run
+        self.parameters_refresh_pending = False
+        self.parameters_lock = threading.Lock()
+        
+        # The worksheets are looked up again at the start of the next run when the user asks for it
+        self.worksheets_refresh_pending = False
+        
+        # Journal of the write phases of the current run
+        self.journal = CommitJournal()
+        self.write_lock = threading.Lock()
+
+    def connect(self):
+        """
+        Start connecting to the sheet in the background, unless a connection is ready or under way
+        
+        Returns:
+            concurrent.futures.Future: Future of the connected LTRC manager
+        """
+        if self.connection is None or self.connection_failed():
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets-connect")
+            self.connection = executor.submit(LTRC_manager, self.sheet)
+            executor.shutdown(wait=False)
+        return self.connection
+
+    def is_connected(self):
+        """Check whether the connection to the sheet is ready, without waiting"""
+        return self.connection.done() and self.connection.exception() is None
+
+    def connection_failed(self):
+        """Check whether the last connection attempt failed, without waiting"""
+        return self.connection.done() and self.connection.exception() is not None
+
+    @property
+    def LTRC(self):
+        """The connected LTRC manager, waiting for the connection only if it is not ready yet"""
+        return self.connection.result()
 
     def set_mode(self, mode):
         self.LTRC.mode = mode
 
     def toggle_32track(self, enabled):
         self.flag_32track = enabled
-        self.LTRC.flag_32track = enabled
 
     def toggle_200cc(self, enabled):
         self.flag_200cc = enabled
-        self.LTRC.flag_200cc = enabled
 
     def toggle_ott(self, enabled):
         self.flag_ott = enabled
+
+    def refresh_parameters(self):
+        """Forget the cached K and C values so the next run reads them from the sheet"""
+        self.parameters_refresh_pending = True
         
+        # Without a connection the cache is cleared once a run has connected, even after a retry
+        if self.is_connected():
+            self._apply_parameters_refresh()
+
+    def _apply_parameters_refresh(self):
+        """Clear the cached K and C values of the connected LTRC manager if a reload was asked for"""
+        with self.parameters_lock:
+            if self.parameters_refresh_pending:
+                self.LTRC.parameter_cache.clear()
+                self.parameters_refresh_pending = False
+
+    def refresh_worksheets(self):
+        """Fetch the tabs of the spreadsheet again at the start of the next run, in case they were changed"""
+        self.worksheets_refresh_pending = True
 
     def get_table_data(self, progress_callback=None):
         """
@@ -40,8 +138,22 @@ class LTRCModel:
         Returns:
             Tuple containing racers, scores, MMRs, deltas, new_MMRs
         """
+        # Reloads asked for since the last run
+        self._apply_parameters_refresh()
+        if self.worksheets_refresh_pending:
+            self.worksheets_refresh_pending = False
+            self.LTRC.load_worksheets(refresh=True)
+        
+        # The options are picked while connecting, they are handed to the LTRC manager for this run
+        self.LTRC.flag_32track = self.flag_32track
+        self.LTRC.flag_200cc = self.flag_200cc
+        
         # Pass the progress callback to the LTRC routine
         self.LTRC.LTRC_routine(progress_callback)
+        
+        # Freshly loaded data starts a new run that has not been written yet
+        self.journal.start_run()
+        self.results = None
 
         racers = self.LTRC.racers
         scores = [f"{score}" for score in self.LTRC.scores]
@@ -61,14 +173,88 @@ class LTRCModel:
         """
         Update the sheet with detailed progress tracking
         
+        Phases that already finished in the current run are skipped, so calling
+        this again for the same run makes no API calls.
+        
         Args:
             progress_callback: Optional callback function for progress updates
+            
+        Returns:
+            WritePlan: The committed plan, with the number of cells sent and calls made
         """
-        # Pass the progress callback to the LTRC manager for detailed updates
-        self.LTRC.update_placements_MMR(progress_callback)
-        self.LTRC.update_sheet(progress_callback)
-        self.LTRC.clear_table(progress_callback)
+        with self.write_lock:
+            # Collect all changes in a single write plan
+            write_plan = self.LTRC.create_write_plan()
+            
+            # Map each phase to the LTRC manager method that queues it
+            phase_methods = {
+                "placements_mmr": self.LTRC.update_placements_MMR,
+                "playerdata": self.LTRC.update_sheet,
+                "clear_table": self.LTRC.clear_table,
+            }
+            
+            # Pass the progress callback to the LTRC manager for detailed updates
+            queued_phases = []
+            for phase in WRITE_PHASES:
+                if not self.journal.is_done(phase):
+                    phase_methods[phase](progress_callback, write_plan)
+                    queued_phases.append(phase)
+            
+            # Send every change to the sheet at once
+            write_plan.commit(progress_callback)
+            self.journal.mark_done(queued_phases)
+        
+        if progress_callback:
+            progress_callback(100, "Sheet update complete!")
+        
+        return write_plan
+        
+    def custom_title(self):
+        """Create the image title based on the enabled options"""
+        title_parts = []
+        
+        if self.flag_32track:
+            title_parts.append("32 Track")
+            
+        if self.flag_200cc:
+            title_parts.append("200cc")
+            
+        if self.flag_ott:
+            title_parts.append("OTT")
+            
+        # Add the format type and "Results"
+        title_parts.append(f"{self.LTRC.mode} Results")
+        
+        # Join all parts with spaces
+        return " ".join(title_parts)
+
+    def get_results(self):
+        """Get the player results of the current run, reading them from the sheet once"""
+        with self.results_lock:
+            if self.results is None:
+                self.results = self.LTRC.get_results()
+            return self.results
+
+    def generate_preview(self, subtitle, custom_title=None, scale=PREVIEW_SCALE, cancelled=None):
+        """
+        Generate a reduced size preview of the results image, without progress updates
+        
+        Args:
+            subtitle: Text to display as subtitle
+            custom_title: Optional custom title text
+            scale: Size of the preview relative to the full image
+            cancelled: Optional function returning True once the preview is no longer wanted,
+                       the render then stops with imagegen.RenderCancelled
+            
+        Returns:
+            PIL.Image: The preview image
+        """
+        # The imaging libraries are only loaded once an image is rendered
+        from imagegen import LTRCImageGenerator
         
+        generator = LTRCImageGenerator(self.LTRC.mode, ConfigService.get(), scale=scale, cancelled=cancelled)
+        return generator.generate(self.get_results(), subtitle, custom_title)
+
     def generate_image(self, subtitle, progress_callback=None, custom_title=None):
         """
         Generate an image with the tournament results
@@ -81,31 +267,10 @@ class LTRCModel:
         Returns:
             PIL.Image: The generated image
         """
-        # Load the image generator config
-        try:
-            # Get the correct base path that works with PyInstaller
-            if getattr(sys, 'frozen', False):
-                base_path = sys._MEIPASS
-            else:
-                base_path = os.path.dirname(os.path.abspath(__file__))
-                
-            config_path = os.path.join(base_path, "config.json")
-            
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-            
-            # Update file paths in the config to be absolute
-            if 'font_file' in config:
-                config['font_file'] = os.path.join(base_path, config['font_file'])
-            
-            if 'background_image' in config:
-                config['background_image'] = os.path.join(base_path, config['background_image'])
-            
-            # Ensure the rank_icons folder path is absolute
-            config['rank_icons_dir'] = os.path.join(base_path, 'rank_icons')
-
-        except Exception as e:
-            raise RuntimeError(f"Failed to load image generator config from {config_path}")
+        from imagegen import LTRCImageGenerator
+        
+        # The configuration is only read again when config.json changed
+        config = ConfigService.get()
         
         # Create the image generator with the current format and required config
         generator = LTRCImageGenerator(
@@ -114,26 +279,46 @@ class LTRCModel:
             progress_callback=progress_callback
         )
         
-        # Get the player results from LTRC
-        results = self.LTRC.get_results()
+        # The results are read once per run, so title and subtitle edits only redraw the header
+        results = self.get_results()
         
         # Generate the image with custom title
         self.generated_image = generator.generate(results, subtitle, custom_title)
         
+        # Encodings of the previous image are no longer valid
+        self.exporter = ImageExporter(self.generated_image)
+        
         # Return the image object
         return self.generated_image
     
-    def save_image_to_file(self, filename=None):
+    def export_image(self, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Encode the generated image, each format is encoded once and shared by the clipboard, files and uploads
+        
+        Args:
+            export_format: Key of the format in exporter.EXPORT_FORMATS
+            
+        Returns:
+            EncodedImage: The encoded image or None if no image was generated
+        """
+        exporter = self.exporter
+        if exporter is None:
+            return None
+        return exporter.encode(export_format)
+    
+    def save_image_to_file(self, filename=None, export_format=DEFAULT_EXPORT_FORMAT):
         """
         Save the generated image to a file if needed
         
         Args:
             filename: Optional custom filename, otherwise auto-generated
+            export_format: Key of the format in exporter.EXPORT_FORMATS
             
         Returns:
             str: Path to the saved image or None if no image was generated
         """
-        if self.generated_image is None:
+        encoded = self.export_image(export_format)
+        if encoded is None:
             return None
             
         # Create an 'images' directory if it doesn't exist
@@ -142,14 +327,7 @@ class LTRCModel:
         # Generate filename if not provided
         if filename is None:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"tournament_{self.LTRC.mode}_{timestamp}.png"
-        
-        # Ensure filename has .png extension
-        if not filename.lower().endswith('.png'):
-            filename += '.png'
+            filename = f"tournament_{self.LTRC.mode}_{timestamp}"
             
-        filepath = os.path.join('images', filename)
-        self.generated_image.save(filepath)
-        
-        # Return the full path to the saved image
-        return os.path.abspath(filepath)
\ No newline at end of file
+        # The extension of the format is added if it is missing
+        return encoded.save(os.path.join('images', filename))
@@ -0,0 +1,307 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from MMR import (LTRC_manager, PlayerIndex, TEAM_SIZES, calculate_mmr_changes,
+                 placement_MMR, rank_teams)
+
+'''
+Season replay: recompute the ratings of a whole season from a log of its events.
+
+Every event is a dictionary like the room typed into TR_Tables:
+    {"mode": "2vs2", "racers": ["A", "B", ...], "scores": [80, 75, ...],
+     "flag_32track": false, "flag_200cc": false}
+with the racers in table order. The events are processed in order with the same
+placement and rating rules as LTRC_manager, and the final ratings are written
+back to Playerdata and Placements in a single batch.
+'''
+
+# Placement progress after playing a placement event
+NEXT_COMPLETION = {"": "1/3", "1/3": "2/3", "2/3": "3/3"}
+
+def load_events(path):
+    '''
+    Load an event log from a JSON file holding a list of events, or a JSON lines file
+
+    Args:
+        path: Path to the event log
+
+    Returns:
+        list: The events in order
+    '''
+    with open(path, 'r') as f:
+        text = f.read()
+
+    try:
+        events = json.loads(text)
+    except json.JSONDecodeError:
+        events = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if not isinstance(events, list):
+        raise ValueError(f"Event log {path} must hold a list of events")
+    return events
+
+class SeasonReplay():
+    def __init__(self, parameters):
+        '''
+        Args:
+            parameters: Function (mode, num_players) returning a dictionary with the K values
+                        of the mode under 'k' and the C value under 'C', like LTRC_manager.load_parameters
+        '''
+        self.parameters = parameters
+        self.parameter_cache = {}
+
+        # State of every player by casefolded name
+        self.players = {}
+        self.events_processed = 0
+
+    @classmethod
+    def from_sheet(cls, LTRC):
+        '''
+        Create a replay that starts the season from the Playerdata worksheet:
+        every player is unplaced, with their previous season MMR from column K
+
+        Args:
+            LTRC: Connected LTRC_manager
+
+        Returns:
+            SeasonReplay: The replay
+        '''
+        replay = cls(LTRC.load_parameters)
+        player_index = PlayerIndex(LTRC.Playerdata)
+
+        # Players are listed in the name column below the header
+        for row in range(2, player_index.next_row):
+            name = player_index.value(row, 1)
+            if name:
+                replay.add_player(name, previous_season_MMR=player_index.value(row, 11))
+
+        return replay
+
+    def add_player(self, name, mmr=None, previous_season_MMR=None, completion="", points=None, mmr_accum=0):
+        '''
+        Set the starting state of a player
+
+        Args:
+            name: Name of the player
+            mmr: Current MMR, or None if the player is unplaced
+            previous_season_MMR: MMR of the previous season, used when the player gets placed
+            completion: Placement progress, "", "1/3" or "2/3"
+            points: Points of the placement events played so far
+            mmr_accum: MMR gained or lost during the placement events played so far
+        '''
+        self.players[name.casefold()] = {
+            'name': name,
+            'mmr': mmr,
+            'previous_season_MMR': previous_season_MMR,
+            'completion': completion,
+            'points': list(points or []),
+            'mmr_accum': mmr_accum,
+            'events': 0,
+        }
+
+    def _player(self, name):
+        '''
+        Get the state of a player, adding players that are not known yet as unplaced
+        '''
+        key = name.casefold()
+        if key not in self.players:
+            self.add_player(name)
+        return self.players[key]
+
+    def _parameters(self, mode, num_players):
+        '''
+        Get the K values and C value for a room, asking the parameter source once per mode and room size
+        '''
+        key = (mode, num_players)
+        if key not in self.parameter_cache:
+            self.parameter_cache[key] = self.parameters(mode, num_players)
+        return self.parameter_cache[key]
+
+    def process_event(self, event):
+        '''
+        Apply a single event to the player states
+
+        Args:
+            event: Event dictionary, see the module description
+
+        Returns:
+            Tuple of lists holding the MMR changes and new MMRs of the racers
+        '''
+        mode = event['mode']
+        racers = event['racers']
+        scores = [int(score) for score in event['scores']]
+        flag_32track = event.get('flag_32track', False)
+        flag_200cc = event.get('flag_200cc', False)
+
+        if len(racers) == 0:
+            raise ValueError("No racers found in the event")
+
+        if len(racers) != len(scores):
+            raise ValueError("The number of racers and scores do not match")
+
+        players = [self._player(racer) for racer in racers]
+        LR_list = []
+        completion = []
+        event_points = []
+
+        for player, score in zip(players, scores):
+            if player['mmr'] is not None:
+                # Placed racers play with their current MMR
+                LR_list.append(player['mmr'])
+                completion.append("")
+                event_points.append(None)
+                continue
+
+            if player['completion'] not in NEXT_COMPLETION:
+                raise ValueError(f"Placement for {player['name']} is inconsistent: {player['completion']} completion but MMR is unknown")
+
+            # The MMR of unplaced racers is assumed from their placement events
+            points = score / 2.67 if flag_32track else score
+            new_completion = NEXT_COMPLETION[player['completion']]
+            previous_season_MMR = player['previous_season_MMR'] if new_completion == "3/3" else None
+
+            LR_list.append(placement_MMR([points] + player['points'], previous_season_MMR, player['mmr_accum']))
+            completion.append(new_completion)
+            event_points.append(points)
+
+        # Rate the room like LTRC_routine does
+        team_size = TEAM_SIZES[mode]
+        rankings = rank_teams(scores, team_size)
+        parameters = self._parameters(mode, len(racers))
+        k_values = np.asarray(parameters['k'])[rankings - 1]
+        delta_MMRs, MMR_new = calculate_mmr_changes(LR_list, k_values, parameters['C'], team_size, flag_32track, flag_200cc)
+        delta_MMRs = delta_MMRs.tolist()
+        MMR_new = MMR_new.tolist()
+
+        # Apply the results like update_placements_MMR and update_sheet do
+        for i, player in enumerate(players):
+            player['events'] += 1
+            if completion[i]:
+                player['completion'] = completion[i]
+                player['points'].append(event_points[i])
+                player['mmr_accum'] += delta_MMRs[i]
+            if not completion[i] or completion[i] == "3/3":
+                player['mmr'] = MMR_new[i]
+
+        self.events_processed += 1
+        return delta_MMRs, MMR_new
+
+    def run(self, events, progress_callback=None):
+        '''
+        Process a list of events in order
+
+        Args:
+            events: The events of the season, in the order they were played
+            progress_callback: Function to report progress (percentage, message)
+        '''
+        total = len(events)
+        for i, event in enumerate(events, start=1):
+            try:
+                self.process_event(event)
+            except (KeyError, ValueError, IndexError) as e:
+                raise ValueError(f"Event {i} could not be replayed: {e}") from e
+
+            if progress_callback and (i % 100 == 0 or i == total):
+                progress_callback(int(100 * i / total), f"Replayed {i}/{total} events")
+
+    def results(self):
+        '''
+        Get the final state of every player that played at least one event
+
+        Returns:
+            list: Player state dictionaries, highest MMR first and unplaced players last
+        '''
+        played = [player for player in self.players.values() if player['events'] > 0]
+        return sorted(played, key=lambda player: (player['mmr'] is None, -(player['mmr'] or 0), player['name']))
+
+    def write(self, LTRC):
+        '''
+        Write the final ratings and placement progress back to the sheet in a single batch
+
+        Args:
+            LTRC: Connected LTRC_manager
+
+        Returns:
+            WritePlan: The committed plan, with the number of cells sent and calls made
+        '''
+        # Locate the rows of the players
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            index_future = executor.submit(PlayerIndex, LTRC.Playerdata)
+            placements_future = executor.submit(LTRC.Placements.get_all_values)
+            player_index = index_future.result()
+            placements_data = placements_future.result()
+
+        placements_rows = {}
+        placements_row = 5  # First row after the header rows
+        for row_idx, row in enumerate(placements_data, start=1):
+            if row and row[0]:
+                if row_idx >= 5:
+                    placements_rows.setdefault(row[0].casefold(), row_idx)
+                placements_row = max(placements_row, row_idx + 1)
+
+        write_plan = LTRC.create_write_plan()
+
+        for player in self.results():
+            name = player['name']
+            mmr = player['mmr'] if player['mmr'] is not None else "???"
+
+            # Update the MMR in Playerdata, adding players that are missing
+            cell = player_index.find(name)
+            if cell is None:
+                row = player_index.append({1: name, 4: mmr})
+                write_plan.update_cell(LTRC.Playerdata, row, 1, name)
+            else:
+                row = cell.row
+            write_plan.update_cell(LTRC.Playerdata, row, 4, mmr)
+
+            # Update the placement progress of players that went through placements
+            if player['completion']:
+                row = placements_rows.get(name.casefold())
+                if row is None:
+                    row = placements_row
+                    placements_row += 1
+                    write_plan.update_cell(LTRC.Placements, row, 1, name)
+
+                points = player['points'] + [""] * (3 - len(player['points']))
+                write_plan.update_cell(LTRC.Placements, row, 2, player['completion'])
+                write_plan.update(LTRC.Placements, f"D{row}:F{row}", [points])
+                write_plan.update_cell(LTRC.Placements, row, 8, player['mmr_accum'])
+
+        write_plan.commit()
+        return write_plan
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the ratings of a season from its event log")
+    parser.add_argument("events", help="JSON or JSON lines file with the events of the season, in order")
+    parser.add_argument("--write", action="store_true", help="Write the final ratings back to the sheet")
+    args = parser.parse_args()
+
+    events = load_events(args.events)
+
+    LTRC = LTRC_manager()
+    replay = SeasonReplay.from_sheet(LTRC)
+
+    start = time.perf_counter()
+    replay.run(events)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {replay.events_processed} events in {elapsed:.2f}s")
+
+    for player in replay.results():
+        mmr = player['mmr'] if player['mmr'] is not None else f"??? ({player['completion']})"
+        print(f"{player['name']:<24} {mmr}")
+
+    if args.write:
+        write_plan = replay.write(LTRC)
+        print(f"Wrote {write_plan.cells_sent} cells in {write_plan.calls_made} API call(s)")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        sys.exit(1)
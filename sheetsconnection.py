@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import gspread
+from gspread.spreadsheet import Spreadsheet
+from google.oauth2 import service_account
+
+from appconfig import get_base_path, get_data_path
+
+'''
+Connection to Google Sheets that is set up once per process and reused by every LTRC_manager.
+
+The key of the spreadsheet is looked up by its title once and stored locally, so later
+launches open it directly instead of searching Drive. The metadata of the spreadsheet is
+fetched once and every worksheet handle is built from it, until LTRC_manager.load_worksheets
+refreshes it when a worksheet is missing or the user asks for a reload. Access tokens are stored next
+to the spreadsheet keys and only exchanged again when they expire.
+
+This module imports gspread and google.oauth2, it is only imported when connecting.
+'''
+
+SCOPES = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/spreadsheets',
+          'https://www.googleapis.com/auth/drive.file', 'https://www.googleapis.com/auth/drive']
+
+CREDENTIALS_FILE = 'auto-mmr-calculator-9676e1429d9a.json'
+
+class ConnectionState():
+    """
+    Spreadsheet keys by title and access tokens by service account, stored in a local JSON file
+    """
+    def __init__(self, path):
+        '''
+        Args:
+            path: Path to the state file
+        '''
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'spreadsheets': {}, 'tokens': {}}
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.data['spreadsheets'].update(data.get('spreadsheets', {}))
+            self.data['tokens'].update(data.get('tokens', {}))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable connection state {self.path}: {e}")
+
+    def spreadsheet_key(self, title):
+        """Get the stored key of a spreadsheet, or None"""
+        return self.data['spreadsheets'].get(title)
+
+    def store_spreadsheet_key(self, title, key):
+        """Remember the key of a spreadsheet, None forgets it"""
+        with self.lock:
+            if key is None:
+                self.data['spreadsheets'].pop(title, None)
+            else:
+                self.data['spreadsheets'][title] = key
+            self._save()
+
+    def token(self, account):
+        """
+        Get the stored access token of a service account
+
+        Returns:
+            Tuple of the token and its expiry as a naive UTC datetime, or None
+        """
+        entry = self.data['tokens'].get(account)
+        if not entry:
+            return None
+        try:
+            return entry['token'], datetime.fromisoformat(entry['expiry'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def store_token(self, account, token, expiry):
+        """Remember the access token of a service account"""
+        with self.lock:
+            self.data['tokens'][account] = {'token': token, 'expiry': expiry.isoformat() if expiry else None}
+            self._save()
+
+    def _save(self):
+        '''
+        Write the state atomically, readable by the current user only since it holds access tokens
+        '''
+        temp_path = f"{self.path}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.data, f, indent=4)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not save the connection state to {self.path}: {e}")
+
+class PersistentCredentials(service_account.Credentials):
+    """
+    Service account credentials that store every new access token in the connection state
+    """
+    state = None
+
+    def refresh(self, request):
+        super().refresh(request)
+        if self.state is not None:
+            self.state.store_token(self.service_account_email, self.token, self.expiry)
+
+class CachedSpreadsheet(Spreadsheet):
+    """
+    Spreadsheet that fetches its metadata once, every worksheet handle is built from that copy
+    until refresh_metadata() is called
+    """
+    def fetch_sheet_metadata(self, params=None):
+        # Requests with parameters ask for something else than the plain metadata
+        if params is not None:
+            return super().fetch_sheet_metadata(params)
+
+        if getattr(self, '_metadata', None) is None:
+            self._metadata = super().fetch_sheet_metadata()
+        return self._metadata
+
+    def refresh_metadata(self):
+        """Fetch the metadata again, e.g. after worksheets were added or moved"""
+        self._metadata = None
+        return self.fetch_sheet_metadata()
+
+class SheetsConnection():
+    """
+    One authorized gspread client, with its HTTP session, and one handle per spreadsheet for the whole process
+    """
+    state_path = os.path.join(get_data_path(), "sheets_connection.json")
+    credentials_path = os.path.join(get_base_path(), CREDENTIALS_FILE)
+    _state = None
+    _client = None
+    _spreadsheets = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_state(cls):
+        if cls._state is None:
+            cls._state = ConnectionState(cls.state_path)
+        return cls._state
+
+    @classmethod
+    def client(cls):
+        """
+        Get the authorized client, authorizing on first use with a stored access token if it is still valid
+
+        Returns:
+            gspread.Client: The client
+        """
+        with cls._lock:
+            if cls._client is None:
+                state = cls._get_state()
+                PersistentCredentials.state = state
+                creds = PersistentCredentials.from_service_account_file(cls.credentials_path, scopes=SCOPES)
+
+                # A stored token saves the token exchange, an expired one is refreshed on the first request
+                stored = state.token(creds.service_account_email)
+                if stored is not None:
+                    creds.token, creds.expiry = stored
+
+                cls._client = gspread.authorize(creds)
+            return cls._client
+
+    @classmethod
+    def open(cls, title):
+        """
+        Get the handle of a spreadsheet, opening it by its stored key
+
+        Args:
+            title: Title of the spreadsheet
+
+        Returns:
+            CachedSpreadsheet: The spreadsheet
+        """
+        client = cls.client()
+
+        with cls._lock:
+            if title in cls._spreadsheets:
+                return cls._spreadsheets[title]
+
+            state = cls._get_state()
+            key = state.spreadsheet_key(title)
+            spreadsheet = None
+
+            if key is not None:
+                try:
+                    spreadsheet = CachedSpreadsheet(client.http_client, {"id": key})
+                except gspread.exceptions.APIError as e:
+                    # The stored key is stale if the spreadsheet was replaced or unshared, look it up again
+                    if e.response.status_code not in (403, 404):
+                        raise
+                    state.store_spreadsheet_key(title, None)
+
+            if spreadsheet is None:
+                spreadsheet = CachedSpreadsheet(client.http_client, {"id": cls._find_key(client, title)})
+                state.store_spreadsheet_key(title, spreadsheet.id)
+
+            cls._spreadsheets[title] = spreadsheet
+            return spreadsheet
+
+    @staticmethod
+    def _find_key(client, title):
+        '''
+        Find the key of a spreadsheet by its title with a Drive search, like gspread.Client.open
+        '''
+        for spreadsheet_file in client.list_spreadsheet_files(title):
+            if spreadsheet_file['name'] == title:
+                return spreadsheet_file['id']
+        raise gspread.exceptions.SpreadsheetNotFound(f"No spreadsheet named {title}")
@@ -1,9 +1,35 @@
 from PyQt6.QtWidgets import (QMainWindow, QVBoxLayout, QPushButton, QComboBox, QCheckBox, 
                             QWidget, QTableWidget, QTableWidgetItem, QHBoxLayout, QLabel, 
-                            QHeaderView, QLineEdit, QProgressBar, QScrollArea)
-from PyQt6.QtCore import Qt, QCoreApplication
+                            QHeaderView, QLineEdit, QProgressBar, QScrollArea, QSizePolicy)
+from PyQt6.QtCore import Qt, QCoreApplication, QTimer
 from PyQt6.QtGui import QPixmap, QImage, QResizeEvent
+from PyQt6 import sip
 import os
+from collections import OrderedDict
+from exporter import EXPORT_FORMATS, DEFAULT_EXPORT_FORMAT
+
+# Scaled images are cached per bucket of this many pixels, and rescaled at most once per interval while resizing
+SCALE_BUCKET = 32
+RESIZE_INTERVAL = 50  # milliseconds
+SCALED_PIXMAP_CACHE_SIZE = 8
+
+def pil_to_pixmap(pil_image):
+    """
+    Convert a PIL image to a QPixmap, handing the RGBA pixels to Qt as they are
+
+    Args:
+        pil_image: The PIL image
+
+    Returns:
+        QPixmap: The pixmap
+    """
+    if pil_image.mode != 'RGBA':
+        pil_image = pil_image.convert('RGBA')
+
+    # The QImage only wraps the buffer, QPixmap.fromImage makes the one copy Qt needs while it is alive
+    data = pil_image.tobytes()
+    q_image = QImage(data, pil_image.width, pil_image.height, pil_image.width * 4, QImage.Format.Format_RGBA8888)
+    return QPixmap.fromImage(q_image)
 
 class LTRCView(QMainWindow):
     def __init__(self):
@@ -21,16 +47,29 @@ class LTRCView(QMainWindow):
         self.cb_32track = QCheckBox("32 Track")
         self.cb_200cc = QCheckBox("200cc")
         self.cb_ott = QCheckBox("OTT")
+        self.refresh_parameters_button = QPushButton("Reload K/C values and tabs from sheet")
+        self.connection_label = QLabel("")
+        self.connection_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.connection_label.setWordWrap(True)
         
         # Initialize the image generation flag
         self.image_generated = False
         self.image_path = None
+        
+        # Scaled versions of the shown image by size bucket, least recently used first, and the timer throttling rescales
+        self.scaled_pixmaps = OrderedDict()
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_INTERVAL)
+        self.resize_timer.timeout.connect(self.scale_image)
 
         self.layout.addWidget(self.dropdown)
         self.layout.addWidget(self.cb_32track)
         self.layout.addWidget(self.cb_200cc)
         self.layout.addWidget(self.cb_ott)
         self.layout.addWidget(self.start_button)
+        self.layout.addWidget(self.refresh_parameters_button)
+        self.layout.addWidget(self.connection_label)
 
     def restart(self):
         # Clear the existing layout
@@ -49,6 +88,10 @@ class LTRCView(QMainWindow):
         self.cb_32track = QCheckBox("32 Track")
         self.cb_200cc = QCheckBox("200cc")
         self.cb_ott = QCheckBox("OTT")
+        self.refresh_parameters_button = QPushButton("Reload K/C values and tabs from sheet")
+        self.connection_label = QLabel("")
+        self.connection_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.connection_label.setWordWrap(True)
         
         # Reset the image generation flag and path
         self.image_generated = False
@@ -59,7 +102,15 @@ class LTRCView(QMainWindow):
         self.layout.addWidget(self.cb_200cc)
         self.layout.addWidget(self.cb_ott)
         self.layout.addWidget(self.start_button)
+        self.layout.addWidget(self.refresh_parameters_button)
+        self.layout.addWidget(self.connection_label)
         
+    def show_connection_status(self, message):
+        """Show the state of the connection to the sheet on the main screen"""
+        # The label is gone once another screen replaced the main screen
+        if hasattr(self, 'connection_label') and not sip.isdeleted(self.connection_label):
+            self.connection_label.setText(message)
+
     def show_loading_screen(self, title_text="Loading...", initial_status="Initialising..."):
         """
         Show a loading screen with progress bar and status label
@@ -229,6 +280,14 @@ class LTRCView(QMainWindow):
         self.image_info_text.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.layout.addWidget(self.image_info_text)
 
+        # Create the live preview pane, the pixmap is scaled to the label so it never drives the layout
+        self.preview_label = QLabel("Rendering preview...", self)
+        self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview_label.setMinimumSize(320, 180)
+        self.preview_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.layout.addWidget(self.preview_label, 1)
+        self.preview_pixmap = None
+
         # Add buttons
         self.skip_button = QPushButton("Skip Image Generation", self)
         self.generate_button = QPushButton("Generate Image", self)
@@ -244,6 +303,24 @@ class LTRCView(QMainWindow):
         # Set the widget as the central widget
         self.setCentralWidget(self.widget)
 
+    def show_preview(self, pixmap):
+        """Show a rendered preview in the preview pane of the image generation screen"""
+        if not hasattr(self, 'preview_label'):
+            return
+        
+        self.preview_pixmap = pixmap
+        self.preview_label.setPixmap(pixmap.scaled(
+            self.preview_label.width(),
+            self.preview_label.height(),
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        ))
+
+    def show_preview_status(self, message):
+        """Show a status message in the preview pane until the first preview is ready"""
+        if hasattr(self, 'preview_label') and self.preview_pixmap is None:
+            self.preview_label.setText(message)
+
     def show_image_progress_screen(self):
         """Show loading screen for image generation"""
         self.show_loading_screen("Generating Image...", "Starting image generation...")
@@ -278,6 +355,13 @@ class LTRCView(QMainWindow):
             # Add image action buttons
             button_layout = QHBoxLayout()
             
+            # Add the export format selection, used by copy and save
+            self.export_format_combo = QComboBox(self)
+            for key, export_format in EXPORT_FORMATS.items():
+                self.export_format_combo.addItem(export_format["label"], key)
+            self.export_format_combo.setCurrentIndex(self.export_format_combo.findData(DEFAULT_EXPORT_FORMAT))
+            button_layout.addWidget(self.export_format_combo)
+            
             # Add "Copy to Clipboard" button
             self.copy_button = QPushButton("Copy Image to Clipboard", self)
             button_layout.addWidget(self.copy_button)
@@ -317,26 +401,41 @@ class LTRCView(QMainWindow):
     def scale_image(self):
         """Scale the image to fit the current window size while maintaining aspect ratio"""
         if hasattr(self, 'original_pixmap') and hasattr(self, 'image_label') and hasattr(self, 'scroll_area'):
-            # Get the available size in the scroll area
+            # Get the available size in the scroll area, rounded down to a bucket so
+            # nearby sizes share one scaled pixmap
             available_width = self.scroll_area.width() - 20  # Subtract some padding
             available_height = self.scroll_area.height() - 20  # Subtract some padding
+            bucket_width = max(SCALE_BUCKET, available_width // SCALE_BUCKET * SCALE_BUCKET)
+            bucket_height = max(SCALE_BUCKET, available_height // SCALE_BUCKET * SCALE_BUCKET)
             
-            # Scale the pixmap to fit within the available space while preserving aspect ratio
-            scaled_pixmap = self.original_pixmap.scaled(
-                available_width, 
-                available_height,
-                Qt.AspectRatioMode.KeepAspectRatio, 
-                Qt.TransformationMode.SmoothTransformation
-            )
+            key = (self.original_pixmap.cacheKey(), bucket_width, bucket_height)
+            scaled_pixmap = self.scaled_pixmaps.get(key)
+            if scaled_pixmap is not None:
+                self.scaled_pixmaps.move_to_end(key)
+            else:
+                # Scale the pixmap to fit within the available space while preserving aspect ratio
+                scaled_pixmap = self.original_pixmap.scaled(
+                    bucket_width, 
+                    bucket_height,
+                    Qt.AspectRatioMode.KeepAspectRatio, 
+                    Qt.TransformationMode.SmoothTransformation
+                )
+                
+                # Keep only the most recently used sizes
+                if len(self.scaled_pixmaps) >= SCALED_PIXMAP_CACHE_SIZE:
+                    self.scaled_pixmaps.popitem(last=False)
+                self.scaled_pixmaps[key] = scaled_pixmap
             
             # Update the image label with the scaled pixmap
-            self.image_label.setPixmap(scaled_pixmap)
+            if self.image_label.pixmap().cacheKey() != scaled_pixmap.cacheKey():
+                self.image_label.setPixmap(scaled_pixmap)
 
     def on_resize(self, event: QResizeEvent):
         """Handle window resize events"""
-        # Scale the image when the window is resized
-        if hasattr(self, 'original_pixmap'):
-            self.scale_image()
+        # Rescale at most once per RESIZE_INTERVAL while the window is being resized,
+        # the timer reads the size when it fires so the final size is always used
+        if hasattr(self, 'original_pixmap') and not self.resize_timer.isActive():
+            self.resize_timer.start()
         
         # Call the parent class's resizeEvent
         super().resizeEvent(event)